@@ -0,0 +1,426 @@
+"""End-to-end benchmarks for phrases.py against local stand-ins of its servers.
+
+The cloud server (/login_user, /chat_with_gpt, /backup_voc, /edit_note,
+/delete_from_server, and /sync_voc in the sync_delta scenario) and the
+OpenAI ChatCompletion endpoint are replaced by
+a local HTTP server with a configurable latency and payload size, and the
+inquirer prompts by scripted answers. Every run uses a throwaway HOME, so
+your own vocabulary book is never touched.
+
+    python benchmark.py                         # every scenario, JSON on stdout
+    python benchmark.py lookup sync --latency 50 --output bench_output.txt
+    python benchmark.py test --openai           # grade through ChatCompletion
+
+Each scenario reports its throughput and latency percentiles in milliseconds.
+"""
+import argparse
+import contextlib
+import gzip
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SCENARIOS = ['login', 'lookup', 'browse', 'test', 'notes', 'sync', 'sync_delta']
+
+class FakeServer:
+    """The phrases cloud server and the OpenAI API, answering from memory."""
+    def __init__(self, latency=0.0, jitter=0.0, payload_size=200, examples=3, malformed=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.payload_size = payload_size
+        self.examples = examples
+        self.malformed = malformed
+        self.vocabulary = []
+        # /sync_voc answers 404 like the real server unless this is on
+        self.sync_endpoint = False
+        self.version = 0
+        self.versions = {}
+        self.removed = {}
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), FakeHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.fake = self
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def wait(self):
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def text(self, seed):
+        words = f"{seed} is used in everyday English to talk about something simple".split()
+        text = ' '.join(words)
+        while len(text) < self.payload_size:
+            text += ' ' + random.choice(words)
+        return text[:self.payload_size]
+
+    def lookup_json(self):
+        return {
+            "explanation": self.text("explanation"),
+            "example sentences": [self.text(f"example {i}") for i in range(self.examples)],
+            "translations": [f"翻译{i} " + self.text("translation")[:40] for i in range(self.examples)],
+        }
+
+    def lookup_answer(self):
+        answer = json.dumps(self.lookup_json(), ensure_ascii=False)
+        if random.random() < self.malformed:
+            # the kind of wrapping the app has to repair locally
+            answer = f"Sure! Here it is:\n```json\n{answer}\n```"
+        return answer
+
+    def answer(self, prompt):
+        # lookups ask for JSON, everything else is a free-form evaluation
+        if '"example sentences"' in prompt:
+            return self.lookup_answer()
+        return self.text("evaluation")
+
+    def fill_vocabulary(self, size):
+        self.vocabulary = [{
+            'phrase': f"server phrase {i}",
+            'explanation': self.text("explanation"),
+            'examples': [self.text(f"example {j}") for j in range(self.examples)],
+            'translations': [f"翻译{j}" for j in range(self.examples)],
+            'note': "",
+        } for i in range(size)]
+        self.versions = {}
+        self.removed = {}
+
+    def sync(self, payload):
+        """Applies the client's changes and returns what changed since its cursor."""
+        with self.lock:
+            since = payload.get('cursor') or 0
+            entries = {item['phrase']: item for item in self.vocabulary}
+            sent = set()
+            for item in payload['changes']:
+                self.version += 1
+                entries[item['phrase']] = item
+                self.versions[item['phrase']] = self.version
+                sent.add(item['phrase'])
+            for phrase in payload['deleted']:
+                self.version += 1
+                entries.pop(phrase, None)
+                self.removed[phrase] = self.version
+                sent.add(phrase)
+            self.vocabulary = list(entries.values())
+            # rows from fill_vocabulary have version 0, so a client without a cursor gets them all
+            voc = [item for item in self.vocabulary if item['phrase'] not in sent
+                   and (payload.get('cursor') is None or self.versions.get(item['phrase'], 0) > since)]
+            deleted = [phrase for phrase, version in self.removed.items() if version > since and phrase not in sent]
+            return {'success': True, 'voc': voc, 'deleted': deleted, 'cursor': self.version}
+
+    def handle(self, path, payload):
+        """Returns (status, body) for a POST."""
+        if path == '/login_user':
+            return 200, {'success': True, 'data': {'Username': 'bench', 'ChatGPT Key': ''}}
+        if path == '/chat_with_gpt':
+            return 200, {'success': True, 'output': self.answer(payload['prompt'])}
+        if path == '/backup_voc':
+            known = {item['phrase'] for item in self.vocabulary}
+            with self.lock:
+                self.vocabulary += [item for item in payload['local_voc'] if item['phrase'] not in known]
+            return 200, {'success': True, 'voc': self.vocabulary}
+        if path in ('/edit_note', '/delete_from_server'):
+            return 200, {'success': True}
+        if path == '/v1/chat/completions':
+            prompt = ' '.join(message['content'] for message in payload['messages'])
+            if payload.get('functions'):
+                function_call = {'name': payload['functions'][0]['name'], 'arguments': self.lookup_answer()}
+                message = {'role': 'assistant', 'content': None, 'function_call': function_call}
+            else:
+                message = {'role': 'assistant', 'content': self.answer(prompt)}
+            return 200, {
+                'id': 'chatcmpl-bench', 'object': 'chat.completion', 'created': int(time.time()),
+                'model': payload.get('model'),
+                'choices': [{'index': 0, 'message': message, 'finish_reason': 'stop'}],
+                'usage': {'prompt_tokens': len(json.dumps(payload)) // 4, 'completion_tokens': self.payload_size // 4},
+            }
+        if path == '/sync_voc' and self.sync_endpoint:
+            return 200, self.sync(payload)
+        # /sync_voc among others; the app falls back to /backup_voc
+        return 404, {'success': False, 'message': 'not found'}
+
+class FakeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body go out in separate writes; don't let them wait on delayed ACKs
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.send_json(200, {'success': True})
+
+    def do_POST(self):
+        fake = self.server.fake
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        payload = json.loads(body or b'{}')
+        with fake.lock:
+            fake.requests += 1
+        fake.wait()
+        status, data = fake.handle(self.path, payload)
+        if self.path == '/v1/chat/completions' and payload.get('stream') and status == 200:
+            self.send_stream(data['choices'][0]['message'])
+        else:
+            self.send_json(status, data)
+
+    def send_json(self, status, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_stream(self, message):
+        # server-sent events, a few characters per chunk like the real API
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        function_call = message.get('function_call')
+        content = function_call['arguments'] if function_call else message['content']
+        for start in range(0, len(content), 8):
+            if function_call:
+                delta = {'function_call': {'arguments': content[start:start + 8]}}
+            else:
+                delta = {'content': content[start:start + 8]}
+            chunk = {'id': 'chatcmpl-bench', 'object': 'chat.completion.chunk',
+                     'choices': [{'index': 0, 'delta': delta, 'finish_reason': None}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+def percentile(values, p):
+    # nearest rank
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))]
+
+def summarize(latencies, elapsed, **extra):
+    ms = [value * 1000 for value in latencies]
+    result = {
+        'count': len(latencies),
+        'total_s': round(elapsed, 4),
+        'throughput_per_s': round(len(latencies) / elapsed, 2) if elapsed > 0 else None,
+        'latency_ms': {
+            'mean': round(sum(ms) / len(ms), 3) if ms else None,
+            'p50': round(percentile(ms, 50), 3) if ms else None,
+            'p90': round(percentile(ms, 90), 3) if ms else None,
+            'p99': round(percentile(ms, 99), 3) if ms else None,
+            'max': round(max(ms), 3) if ms else None,
+        },
+    }
+    result.update(extra)
+    return result
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    fn(*args, **kwargs)
+    return time.perf_counter() - start
+
+class ScriptedInput:
+    """Stands in for get_input, timing how long the app took between two prompts."""
+    def __init__(self, answer="This is my translation."):
+        self.answer = answer
+        self.returned_at = None
+        self.gaps = []
+
+    def __call__(self, label="Search", validate=True, password=False):
+        now = time.perf_counter()
+        if self.returned_at is not None:
+            self.gaps.append(now - self.returned_at)
+        self.returned_at = time.perf_counter()
+        return self.answer
+
+def patch_prompts(phrases):
+    phrases.clear_console = lambda: None
+    phrases.wait_for_enter_key = lambda: None
+    phrases.get_selection = lambda options, question, default_idx=0: options[default_idx]
+    phrases.input = lambda *args: ''
+
+def login(phrases, name):
+    # every scenario gets a fresh vocabulary book of its own
+    phrases.login_user(f"{name}@bench.local", "password")
+
+def seed_vocabulary(phrases, fake, size):
+    phrases.insert_records([(f"local phrase {i}", fake.lookup_json(), None)
+                            for i in range(size)])
+
+def bench_login(phrases, fake, args):
+    latencies = []
+    start = time.perf_counter()
+    for i in range(args.iterations):
+        latencies.append(timed(login, phrases, f"login{i}"))
+    return summarize(latencies, time.perf_counter() - start)
+
+def bench_lookup(phrases, fake, args):
+    login(phrases, 'lookup')
+    latencies = []
+    start = time.perf_counter()
+    for i in range(args.iterations):
+        voc = f"bench phrase {i}"
+        def lookup():
+            output_json = phrases.get_results(voc)
+            phrases.insert_record(voc, output_json, skip_message=True)
+        latencies.append(timed(lookup))
+    return summarize(latencies, time.perf_counter() - start)
+
+def bench_browse(phrases, fake, args):
+    login(phrases, 'browse')
+    seed_vocabulary(phrases, fake, args.records)
+    opened = timed(phrases.RecordBrowser, phrases.ListOrderOptions.RANDOM)
+    browser = phrases.RecordBrowser(phrases.ListOrderOptions.RANDOM)
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(args.records):
+        latencies.append(timed(browser.next))
+    return summarize(latencies, time.perf_counter() - start, records=args.records, open_ms=round(opened * 1000, 3))
+
+def bench_test(phrases, fake, args):
+    login(phrases, 'test')
+    seed_vocabulary(phrases, fake, max(args.questions, args.records))
+    script = ScriptedInput()
+    phrases.get_input = script
+    start = time.perf_counter()
+    exercises = phrases.sample_exercises(args.questions)
+    sampled = time.perf_counter() - start
+    phrases.practice_exercises(exercises)
+    elapsed = time.perf_counter() - start
+    # the time from the last answer until every evaluation has been shown
+    finish = time.perf_counter() - script.returned_at
+    return summarize(script.gaps, elapsed, questions=len(exercises),
+                     sample_ms=round(sampled * 1000, 3), final_wait_ms=round(finish * 1000, 3))
+
+def bench_notes(phrases, fake, args):
+    login(phrases, 'notes')
+    seed_vocabulary(phrases, fake, args.iterations)
+    edits, deletes = [], []
+    start = time.perf_counter()
+    for i in range(args.iterations):
+        edits.append(timed(phrases.update_record_note, f"local phrase {i}", "a note"))
+    for i in range(args.iterations):
+        deletes.append(timed(phrases.delete_record, f"local phrase {i}"))
+    elapsed = time.perf_counter() - start
+    return summarize(edits + deletes, elapsed,
+                     edit_note=summarize(edits, sum(edits)), delete=summarize(deletes, sum(deletes)))
+
+def bench_sync(phrases, fake, args):
+    login(phrases, 'sync')
+    fake.fill_vocabulary(args.sync_size)
+    cold = timed(phrases.backup_vocabulary)
+    warm = [timed(phrases.backup_vocabulary) for _ in range(3)]
+    pulled = phrases.get_vocabulary_count('phrases')
+    fake.vocabulary = []
+    return summarize([cold] + warm, cold + sum(warm), phrases=pulled,
+                     cold_s=round(cold, 4), phrases_per_s=round(pulled / cold, 1) if cold > 0 else None)
+
+def bench_sync_delta(phrases, fake, args):
+    login(phrases, 'sync_delta')
+    fake.sync_endpoint = True
+    fake.fill_vocabulary(args.sync_size)
+    cold = timed(phrases.backup_vocabulary)
+    warm = []
+    for i in range(3):
+        # a few local edits and one server-side phrase per round
+        seed = [(f"delta phrase {i} {j}", fake.lookup_json(), None) for j in range(10)]
+        phrases.insert_records(seed)
+        fake.sync({'cursor': fake.version, 'changes': [dict(fake.vocabulary[0], phrase=f"remote phrase {i}")],
+                   'deleted': []})
+        warm.append(timed(phrases.backup_vocabulary))
+    pulled = phrases.get_vocabulary_count('phrases')
+    on_server = len(fake.vocabulary)
+    fake.sync_endpoint = False
+    fake.vocabulary = []
+    return summarize([cold] + warm, cold + sum(warm), phrases=pulled, server_phrases=on_server,
+                     cold_s=round(cold, 4), phrases_per_s=round(pulled / cold, 1) if cold > 0 else None)
+
+BENCHMARKS = {
+    'login': bench_login,
+    'lookup': bench_lookup,
+    'browse': bench_browse,
+    'test': bench_test,
+    'notes': bench_notes,
+    'sync': bench_sync,
+    'sync_delta': bench_sync_delta,
+}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark phrases.py against local fake servers.")
+    parser.add_argument('scenarios', nargs='*', metavar='SCENARIO',
+                        help=f"scenarios to run, out of {', '.join(SCENARIOS)} (default: all of them)")
+    parser.add_argument('--latency', type=float, default=20, help="server latency per request in ms")
+    parser.add_argument('--jitter', type=float, default=0, help="extra random latency per request in ms")
+    parser.add_argument('--payload-size', type=int, default=200, help="characters per explanation or example")
+    parser.add_argument('--malformed', type=float, default=0, help="share of lookup answers wrapped in prose and code fences")
+    parser.add_argument('--iterations', type=int, default=50, help="requests in the login, lookup and notes scenarios")
+    parser.add_argument('--records', type=int, default=1000, help="records in the browse scenario")
+    parser.add_argument('--questions', type=int, default=40, help="questions in the test scenario")
+    parser.add_argument('--sync-size', type=int, default=10000, help="phrases on the server in the sync scenarios")
+    parser.add_argument('--openai', action='store_true', help="talk to the ChatCompletion stand-in instead of /chat_with_gpt")
+    parser.add_argument('--gpt-cache', action='store_true', help="keep the local ChatGPT response cache on")
+    parser.add_argument('--output', help="write the JSON report to this file as well")
+    parser.add_argument('--trace', metavar='FILE', help="also write the app's trace of every span to FILE")
+    args = parser.parse_args()
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario: {', '.join(unknown)}")
+    return args
+
+def main():
+    args = parse_args()
+    home = tempfile.mkdtemp(prefix='phrases-bench-')
+    os.environ['HOME'] = home
+    if not args.gpt_cache:
+        os.environ['PHRASES_NO_GPT_CACHE'] = '1'
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import phrases
+
+    fake = FakeServer(latency=args.latency / 1000, jitter=args.jitter / 1000, payload_size=args.payload_size,
+                      malformed=args.malformed)
+    phrases.SERVER_ADDR = fake.url
+    if args.trace:
+        phrases.start_tracing(args.trace)
+    patch_prompts(phrases)
+    report = {'config': {key: value for key, value in vars(args).items() if key not in ('output', 'trace')}, 'scenarios': {}}
+    try:
+        for name in args.scenarios or SCENARIOS:
+            print(f"running {name} ...", file=sys.stderr)
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                if args.openai:
+                    # the openai module reads its endpoint from api_base
+                    import openai
+                    openai.api_base = fake.url + '/v1'
+                    phrases.KEY = 'sk-bench'
+                requests_before = fake.requests
+                result = BENCHMARKS[name](phrases, fake, args)
+                if args.openai:
+                    phrases.KEY = None
+            result['server_requests'] = fake.requests - requests_before
+            report['scenarios'][name] = result
+    finally:
+        fake.close()
+        phrases.close_db_conns()
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+
+if __name__ == "__main__":
+    main()
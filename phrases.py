@@ -10,23 +10,85 @@ import csv
 import datetime
 import random
 import base64
+import re
+import sys
+import argparse
+import atexit
+import unicodedata
+import hashlib
+import gzip
+import threading
+import functools
+import contextlib
+from collections import namedtuple
+from itertools import groupby
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait as wait_futures
 
 VERSION = "0.4"
 DB_NAME = "vocabulary.db"
 TABLE_NAME = "vocabulary"
+EXAMPLES_TABLE_NAME = "vocabulary_examples"
+FTS_TABLE_NAME = "vocabulary_fts"
+REVIEW_TABLE_NAME = "review_schedule"
+COUNTS_TABLE_NAME = "vocabulary_counts"
+QUEUE_TABLE_NAME = "lookup_queue"
 KEY = None
 CONFIG_DIR = "phrases_configs"
 DEFAULT_VIEW_OPTION_IDX = 0
 REMOTE_CONFIG_URL = 'https://raw.githubusercontent.com/songlinhou/phrases/main/configs/general.json'
 SERVER_ADDR = None
+GPT_MODEL = "gpt-3.5-turbo"
+GPT_CACHE_DB_NAME = "gpt_cache.db"
+GPT_CACHE_TTL = 30 * 24 * 3600
+GPT_CACHE_MAX_ENTRIES = 5000
+GPT_CACHE_ENABLED = os.environ.get("PHRASES_NO_GPT_CACHE") is None
+GRADING_WORKERS = 4
+REVIEW_SESSION_SIZE = 20
+LOOKUP_QUEUE_MAX_ATTEMPTS = 6
+LOOKUP_QUEUE_RETRY_DELAY = 30 # seconds, doubled after every failed attempt
+LOOKUP_QUEUE_MAX_DELAY = 3600
+LOOKUP_QUEUE_IDLE_DELAY = 60
+LOOKUP_WORKER_STOP_TIMEOUT = 5
+STREAM_OUTPUT = os.environ.get("PHRASES_NO_STREAM") is None
+HTTP_CONNECT_TIMEOUT = 5
+HTTP_READ_TIMEOUT = 60
+HTTP_GZIP_REQUESTS = os.environ.get("PHRASES_GZIP_REQUESTS") is not None
+HTTP_GZIP_MIN_BYTES = 64 * 1024
+BATCH_LOOKUP_CONCURRENCY = 8
+BATCH_INSERT_SIZE = 50
+SYNC_PROBE_INTERVAL = 7 * 24 * 3600 # how long a server without /sync_voc is trusted to stay so
+TRACE_FILE = os.environ.get("PHRASES_TRACE")
+PROFILE_FILE = os.environ.get("PHRASES_PROFILE")
 
 
 __cloud_user_email = None
 __cloud_username = None
 __cloud_password = None
 __in_main_menu = True
-
-example = json.dumps({"explanation":"THE EXPLAINATION GOES HERE", "example sentences":["sentence 1", "sentence 2", "sentence 3"], "translations":["翻译1", "翻译2", "翻译3"]})
+__db_conns = {}
+__gpt_cache_stats = {'hits': 0, 'misses': 0}
+__http_session = None
+# set on a thread while it rebuilds the full-text rows of a bulk insert itself
+__fts_deferred = threading.local()
+__lookup_worker = None
+__tracer = None
+
+LOOKUP_SYSTEM_PROMPT = "You explain English phrases in simple words to Chinese learners."
+# the answer's shape, as a function the model is made to call
+LOOKUP_FUNCTION = {
+    "name": "save_phrase",
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "explanation": {"type": "string"},
+            "example sentences": {"type": "array", "items": {"type": "string"}},
+            "translations": {"type": "array", "items": {"type": "string"}, "description": "Chinese"},
+        },
+        "required": ["explanation", "example sentences", "translations"],
+    },
+}
+# the cloud server only passes a prompt on, so it gets the shape spelled out
+LOOKUP_JSON_HINT = 'Reply with JSON only: {"explanation": "", "example sentences": [], "translations": []}'
 
 config_path = os.path.join(str(Path.home()), CONFIG_DIR)
 os.makedirs(config_path, exist_ok=True)
@@ -46,6 +108,20 @@ def title():
         _title += f"\nLogged in as {__cloud_username}"
     return _title
 
+class Screens:
+    LOGIN = "login"
+    MAIN_MENU = "main_menu"
+    EXIT = "exit"
+
+class BackToMenu(Exception):
+    """Raised when the user cancels a prompt; unwinds to the main menu."""
+
+# A phrase of the vocabulary book. The first five fields keep the column
+# order of the old vocabulary table, decoded, for the tuple consumers.
+Record = namedtuple('Record', ['phrase', 'explanation', 'examples', 'translations', 'note', 'id'])
+# one example sentence of a phrase, as it is asked in practice
+Exercise = namedtuple('Exercise', ['phrase', 'explanation', 'example', 'translation', 'note', 'phrase_id', 'position'])
+
 class ListOrderOptions:
     RANDOM = "Randomized"
     EARLIST_FIRST = "Start with Earliest"
@@ -66,41 +142,379 @@ def warn_text(msg):
     ENDC = '\033[0m'
     return WARNING + msg + ENDC
 
+class Tracer:
+    """Writes finished spans to a JSON-lines file and keeps their durations for the summary."""
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'a', encoding='utf-8', buffering=1 << 16)
+        self.lock = threading.Lock()
+        self.durations = {}
+        self.local = threading.local()
+
+    def stack(self):
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+    def record(self, span, duration):
+        line = json.dumps({
+            'name': span.name,
+            'kind': span.kind,
+            'start': round(span.wall, 6),
+            'ms': round(duration * 1000, 3),
+            'thread': threading.current_thread().name,
+            'parent': span.parent,
+            **span.attrs,
+        }, ensure_ascii=False, default=str)
+        with self.lock:
+            self.file.write(line + '\n')
+            self.durations.setdefault((span.kind, span.name), []).append(duration)
+
+    def summary(self, limit=25):
+        rows = sorted(self.durations.items(), key=lambda item: -sum(item[1]))[:limit]
+        lines = [f"{'kind':<8} {'name':<36} {'calls':>7} {'total ms':>10} {'mean ms':>9} {'max ms':>9}"]
+        for (kind, name), durations in rows:
+            total = sum(durations) * 1000
+            lines.append(f"{kind:<8} {name[:36]:<36} {len(durations):>7} {total:>10.1f} "
+                         f"{total / len(durations):>9.2f} {max(durations) * 1000:>9.2f}")
+        return '\n'.join(lines)
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+class Span:
+    __slots__ = ('tracer', 'name', 'kind', 'attrs', 'parent', 'wall', 'start')
+
+    def __init__(self, tracer, name, kind, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.kind = kind
+        self.attrs = attrs
+
+    def __enter__(self):
+        stack = self.tracer.stack()
+        self.parent = stack[-1].name if stack else None
+        stack.append(self)
+        self.wall = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        self.tracer.stack().pop()
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        self.tracer.record(self, duration)
+        return False
+
+NULL_SPAN = contextlib.nullcontext()
+
+def trace_span(name, kind, **attrs):
+    """A context manager timing a block; does nothing unless tracing is on."""
+    if __tracer is None:
+        return NULL_SPAN
+    return Span(__tracer, name, kind, attrs)
+
+def trace_attrs(**attrs):
+    # adds sizes, token counts and the like to the innermost open span
+    if __tracer is None:
+        return
+    stack = __tracer.stack()
+    if stack:
+        stack[-1].attrs.update(attrs)
+
+def traced(kind):
+    """Decorates a function to run in a span named after it."""
+    def decorator(fn):
+        name = fn.__qualname__
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if __tracer is None:
+                return fn(*args, **kwargs)
+            with Span(__tracer, name, kind, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def start_tracing(path):
+    global __tracer
+    if __tracer is None:
+        __tracer = Tracer(path)
+        atexit.register(finish_tracing)
+
+def finish_tracing():
+    global __tracer
+    tracer, __tracer = __tracer, None
+    if tracer is None:
+        return
+    tracer.close()
+    print(f"\nTrace written to {tracer.path}", file=sys.stderr)
+    print(tracer.summary(), file=sys.stderr)
+
+def start_profiling(path):
+    # cProfile only sees the main thread; background work shows up in the trace
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    def dump():
+        profiler.disable()
+        profiler.dump_stats(path)
+        print(f"Profile written to {path}", file=sys.stderr)
+    atexit.register(dump)
+
+@traced('console')
 def clear_console():
     if os.name == "nt":
         os.system('cls')
     else:
         os.system('clear')        
 
-def chat_with_gpt(prompt):
+def get_http_session():
+    # one keep-alive session shared by every call to the server
+    global __http_session
+    if __http_session is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(GRADING_WORKERS, BATCH_LOOKUP_CONCURRENCY))
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        __http_session = session
+    return __http_session
+
+def close_http_session():
+    global __http_session
+    if __http_session is not None:
+        __http_session.close()
+        __http_session = None
+
+atexit.register(close_http_session)
+
+@traced('http')
+def http_get(url, timeout=None):
+    return get_http_session().get(url, timeout=timeout or (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
+
+@traced('http')
+def server_post(path, payload, timeout=None, compress=False):
+    """Posts JSON to SERVER_ADDR, returning None if the server can't be reached in time."""
+    import requests
+    body = json.dumps(payload).encode('utf-8')
+    headers = {'Content-Type': 'application/json'}
+    if compress and HTTP_GZIP_REQUESTS and len(body) >= HTTP_GZIP_MIN_BYTES:
+        body = gzip.compress(body)
+        headers['Content-Encoding'] = 'gzip'
+    trace_attrs(path=path, bytes_sent=len(body))
+    try:
+        resp = get_http_session().post(f"{SERVER_ADDR}{path}", data=body, headers=headers,
+                                       timeout=timeout or (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
+    except requests.RequestException:
+        return None
+    trace_attrs(status=resp.status_code, bytes_received=len(resp.content))
+    return resp
+
+def get_gpt_cache_key(prompt, system=None, function=None):
+    model = GPT_MODEL if KEY is not None else f"cloud:{SERVER_ADDR}"
+    if system is not None or function is not None:
+        prompt = f"{system}\n{json.dumps(function, sort_keys=True)}\n{prompt}"
+    return hashlib.sha256(f"{model}\n{prompt}".encode('utf-8')).hexdigest()
+
+def get_gpt_cache_conn():
+    return open_db(os.path.join(config_path, GPT_CACHE_DB_NAME), GPT_CACHE_MIGRATIONS)
+
+@traced('db')
+def read_gpt_cache(key):
+    conn = get_gpt_cache_conn()
+    now = time.time()
+    row = conn.execute("SELECT response FROM gpt_cache WHERE key = ? AND created_at > ?",
+                       (key, now - GPT_CACHE_TTL)).fetchone()
+    if row is None:
+        __gpt_cache_stats['misses'] += 1
+        return None
+    __gpt_cache_stats['hits'] += 1
+    conn.execute("UPDATE gpt_cache SET accessed_at = ? WHERE key = ?", (now, key))
+    conn.commit()
+    return row[0]
+
+@traced('db')
+def write_gpt_cache(key, response):
+    conn = get_gpt_cache_conn()
+    now = time.time()
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO gpt_cache (key, response, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                     (key, response, now, now))
+        # expire old answers, then keep only the most recently used ones
+        conn.execute("DELETE FROM gpt_cache WHERE created_at <= ?", (now - GPT_CACHE_TTL, ))
+        conn.execute("""
+        DELETE FROM gpt_cache WHERE key IN
+        (SELECT key FROM gpt_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)
+        """, (GPT_CACHE_MAX_ENTRIES, ))
+
+def get_gpt_cache_stats():
+    return dict(__gpt_cache_stats)
+
+def guard_display(on_token):
+    """Wraps a display callback so that an error in it stops the display
+    instead of failing the request, which would then be retried and paid twice."""
+    failed = False
+    def feed(token):
+        nonlocal failed
+        if failed:
+            return
+        try:
+            on_token(token)
+        except Exception:
+            failed = True
+    return feed
+
+@traced('gpt')
+def chat_with_gpt(prompt, use_cache=True, on_token=None, system=None, function=None, parse=None, quiet=False):
+    """Asks ChatGPT and returns the whole answer.
+
+    When on_token is given, it is called with each piece of the answer as
+    soon as it arrives (a cached answer arrives as one piece). With a
+    function, the answer is the JSON arguments of a call to it. When parse is
+    given, its result is returned instead, and an answer it rejects with
+    ValueError is never cached. With quiet, server errors are raised as
+    RuntimeError instead of printed, for callers running in the background.
+    """
+    use_cache = use_cache and GPT_CACHE_ENABLED
+    if on_token is not None:
+        on_token = guard_display(on_token)
+    if use_cache:
+        cache_key = get_gpt_cache_key(prompt, system, function)
+        output = read_gpt_cache(cache_key)
+        trace_attrs(cache_hit=output is not None)
+        if output is not None:
+            try:
+                result = parse(output) if parse is not None else output
+            except ValueError:
+                result = None
+            if result is not None:
+                if on_token is not None:
+                    on_token(output)
+                return result
+    output = request_gpt(prompt, on_token=on_token, system=system, function=function, quiet=quiet)
+    if output is None:
+        return None
+    result = parse(output) if parse is not None else output
+    if use_cache:
+        write_gpt_cache(cache_key, output)
+    return result
+
+@traced('gpt')
+def request_gpt(prompt, on_token=None, system=None, function=None, quiet=False):
     if KEY is not None:
         import openai
         openai.api_key = KEY
+        messages = [{'role': 'user', 'content': prompt}]
+        if system is not None:
+            messages.insert(0, {'role': 'system', 'content': system})
+        options = {}
+        if function is not None:
+            options = {'functions': [function], 'function_call': {'name': function['name']}}
         response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",  # You can choose different engines like "gpt-3.5-turbo" or "davinci"
-            messages=[{'role': 'user', 'content': prompt}]
+            model=GPT_MODEL,  # You can choose different engines like "gpt-3.5-turbo" or "davinci"
+            messages=messages,
+            stream=on_token is not None,
+            **options
         )
-
-        return response.choices[0].message.content.strip()
+        if on_token is None:
+            usage = response.get('usage') or {}
+            trace_attrs(model=GPT_MODEL, prompt_tokens=usage.get('prompt_tokens'),
+                        completion_tokens=usage.get('completion_tokens'))
+            message = response.choices[0].message
+            if function is not None and message.get('function_call'):
+                return message['function_call']['arguments'].strip()
+            return (message.get('content') or '').strip()
+
+        parts = []
+        for chunk in response:
+            delta = chunk['choices'][0]['delta']
+            content = (delta.get('function_call') or {}).get('arguments') or delta.get('content')
+            if content:
+                parts.append(content)
+                on_token(content)
+        # streamed answers carry no usage; the chunk count is close to the token count
+        trace_attrs(model=GPT_MODEL, prompt_chars=len(prompt), completion_chunks=len(parts))
+        return ''.join(parts).strip()
     else:
-        import requests
-        url = f"{SERVER_ADDR}/chat_with_gpt"
-        resp = requests.post(url, json={
+        if system is not None:
+            prompt = f"{system}\n{prompt}"
+        if function is not None:
+            prompt = f"{prompt}\n{LOOKUP_JSON_HINT}"
+        resp = server_post("/chat_with_gpt", {
             'prompt': prompt,
             'email': __cloud_user_email,
             'password': __cloud_password
         })
-        if resp.ok:
+        if resp is not None and resp.ok:
             data = resp.json()
             success = data['success']
             if success:
+                # the server answers in one piece
+                if on_token is not None:
+                    on_token(data['output'])
                 return data['output']
-            else:
-                print(error_text(data['message']))
-                return None
+            message = data['message']
         else:
-            print(error_text("Unable to use Lookup function."))
-            return None
+            message = "Unable to use Lookup function."
+        if quiet:
+            raise RuntimeError(message)
+        print(error_text(message))
+        return None
+
+class JsonStringStreamer:
+    """Prints the string value of one field of a JSON object while the
+    object is still arriving token by token."""
+
+    def __init__(self, field, write=None):
+        self.field = field
+        self.write = write or (lambda text: print(text, end='', flush=True))
+        self.buffer = ''
+        self.start = None
+        self.text = ''
+        self.done = False
+
+    def feed(self, token):
+        self.buffer += token
+        if self.done:
+            return
+        if self.start is None:
+            match = re.search(r'"%s"\s*:\s*"' % re.escape(self.field), self.buffer)
+            if match is None:
+                return
+            self.start = match.end()
+        raw, closed = self._complete_part(self.buffer[self.start:])
+        # as lenient as repair_json, which lets raw newlines through
+        text = json.loads('"' + raw + '"', strict=False)
+        if not closed and text and '\ud800' <= text[-1] <= '\udbff':
+            # wait for the other half of a surrogate pair
+            text = text[:-1]
+        if len(text) > len(self.text):
+            self.write(text[len(self.text):])
+            self.text = text
+        if closed:
+            self.done = True
+            self.write('\n')
+
+    @staticmethod
+    def _complete_part(raw):
+        # the longest prefix that ends outside of an escape sequence, and
+        # whether the closing quote has been reached
+        i = 0
+        while i < len(raw):
+            if raw[i] == '"':
+                return raw[:i], True
+            if raw[i] == '\\':
+                step = 6 if raw[i + 1:i + 2] == 'u' else 2
+                if i + step > len(raw):
+                    return raw[:i], False
+                i += step
+            else:
+                i += 1
+        return raw, False
 
 def validate_non_empty(_, answer):
     import inquirer
@@ -143,7 +557,7 @@ def get_input(label="Search", validate=True, password=False):
         answers = inquirer.prompt(questions)
         return answers[label]
     except:
-        show_menu()
+        raise BackToMenu()
 
 def get_selection(options, question, default_idx = 0):
     import inquirer
@@ -156,33 +570,110 @@ def get_selection(options, question, default_idx = 0):
                     ),
         ]
         answers = inquirer.prompt(questions)
-        if answers is None:
-            # print("Cancelled.")
-            show_menu()
-            
-        return answers['answer']
     except:
         if not __in_main_menu:
-            show_menu()
+            raise BackToMenu()
+        return None
+    if answers is None:
+        # print("Cancelled.")
+        raise BackToMenu()
+    return answers['answer']
         
-def get_db_conn():
+def get_db_path():
     if __cloud_user_email is None:
-        # Connect to the database (or create it if it doesn't exist)
-        conn = sqlite3.connect(DEFAULT_DB_NAME)
-    else:
-        user_dir = os.path.join(config_path, 'users', __cloud_user_email)
-        os.makedirs(user_dir, exist_ok=True)
-        db_name = os.path.join(user_dir, DB_NAME)
-        conn = sqlite3.connect(db_name)
+        return DEFAULT_DB_NAME
+    user_dir = os.path.join(config_path, 'users', __cloud_user_email)
+    os.makedirs(user_dir, exist_ok=True)
+    return os.path.join(user_dir, DB_NAME)
+
+def get_db_conn():
+    # One long-lived connection per profile database and thread; sqlite3 keeps
+    # the prepared statements of each connection in its statement cache.
+    return open_db(get_db_path(), VOCABULARY_MIGRATIONS)
+
+def open_db(db_name, migrations=()):
+    conn_key = (db_name, threading.get_ident())
+    conn = __db_conns.get(conn_key)
+    if conn is None:
+        # Connect to the database (or create it if it doesn't exist).
+        # Each thread only uses its own connection; check_same_thread is off
+        # so that close_db_conns can close all of them at exit.
+        with trace_span('open_db', 'db', path=db_name):
+            conn = sqlite3.connect(db_name, cached_statements=256, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA cache_size=-8000")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            conn.execute("PRAGMA foreign_keys=ON")
+            conn.create_function("cjk_split", 1, cjk_split, deterministic=True)
+            conn.create_function("fts_deferred", 0, is_fts_deferred)
+            migrate_db(conn, migrations)
+        __db_conns[conn_key] = conn
     return conn
 
-def init_db():
-    conn = get_db_conn()
-    # Create a cursor object
-    cursor = conn.cursor()
+def is_fts_deferred():
+    return int(getattr(__fts_deferred, 'active', False))
 
-    # Define the CREATE TABLE statement
-    create_table_sql = f"""
+CJK_PATTERN = re.compile('([\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af])')
+
+def cjk_split(text):
+    # FTS5's unicode61 tokenizer reads a run of CJK characters as one token;
+    # spacing them out makes every character a token of its own.
+    if text is None:
+        return None
+    return CJK_PATTERN.sub(r' \1 ', text)
+
+def close_db_conns():
+    me = threading.get_ident()
+    for (_, thread_id), conn in list(__db_conns.items()):
+        try:
+            # another thread may be halfway through a transaction; never commit it from here
+            if thread_id == me:
+                conn.commit()
+            else:
+                conn.rollback()
+            conn.close()
+        except sqlite3.Error:
+            pass
+    __db_conns.clear()
+
+atexit.register(close_db_conns)
+
+@traced('db')
+def migrate_db(conn, migrations):
+    """Runs the migrations newer than the database's user_version.
+
+    Migration N (1-based) takes the connection and upgrades the schema from
+    version N - 1 to N. Each one runs in its own transaction together with
+    the version bump, so it is applied exactly once per database file.
+    To change the schema, append a function to the list; never edit or
+    reorder the ones that have shipped.
+    """
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version >= len(migrations):
+        return
+    for target, migration in enumerate(migrations, start=1):
+        if target <= version:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # another connection may have migrated while we waited for the lock
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= target:
+                conn.rollback()
+                continue
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {target}")
+            conn.commit()
+        except:
+            conn.rollback()
+            raise
+
+def get_table_columns(cursor, table_name):
+    cursor.execute(f"PRAGMA table_info({table_name})")
+    return [row[1] for row in cursor.fetchall()]
+
+def migrate_create_vocabulary(conn):
+    conn.execute(f"""
     CREATE TABLE IF NOT EXISTS {TABLE_NAME} (
     phases TEXT,
     explanations TEXT,
@@ -190,121 +681,854 @@ def init_db():
     translations TEXT,
     notes TEXT
     );
-    """
+    """)
+    # databases from before notes were added
+    if 'notes' not in get_table_columns(conn.cursor(), TABLE_NAME):
+        conn.execute(f"ALTER TABLE {TABLE_NAME} ADD COLUMN notes TEXT")
 
-    # Execute the CREATE TABLE statement
-    cursor.execute(create_table_sql)
-
-    # Commit the changes to the database
-    conn.commit()
-
-    # Close the connection
-    conn.close()
+def migrate_add_phrase_key(conn):
+    cursor = conn.cursor()
+    if 'phrase_key' not in get_table_columns(cursor, TABLE_NAME):
+        cursor.execute(f"ALTER TABLE {TABLE_NAME} ADD COLUMN phrase_key TEXT")
+
+    # backfill the lookup key and drop the duplicates that piled up without it,
+    # moving their notes onto the row that is kept
+    cursor.execute(f"SELECT rowid, phases, notes FROM {TABLE_NAME} WHERE phrase_key IS NULL ORDER BY rowid")
+    pending = cursor.fetchall()
+    if pending:
+        cursor.execute(f"SELECT phrase_key, rowid, notes FROM {TABLE_NAME} WHERE phrase_key IS NOT NULL")
+        kept = {key: (rowid, json.loads(note) if note else "") for key, rowid, note in cursor.fetchall()}
+        updates = []
+        duplicates = []
+        merged_notes = {}
+        for rowid, phase, note in pending:
+            key = normalize_phrase(json.loads(phase))
+            note = json.loads(note) if note else ""
+            if key not in kept:
+                kept[key] = (rowid, note)
+                updates.append((key, rowid))
+                continue
+            duplicates.append((rowid, ))
+            kept_rowid, kept_note = kept[key]
+            if note.strip() and note.strip() not in kept_note:
+                kept_note = f"{kept_note}\n{note}" if kept_note.strip() else note
+                kept[key] = (kept_rowid, kept_note)
+                merged_notes[kept_rowid] = kept_note
+        cursor.executemany(f"DELETE FROM {TABLE_NAME} WHERE rowid = ?", duplicates)
+        cursor.executemany(f"UPDATE {TABLE_NAME} SET phrase_key = ? WHERE rowid = ?", updates)
+        cursor.executemany(f"UPDATE {TABLE_NAME} SET notes = ? WHERE rowid = ?",
+                           [(json.dumps(note), rowid) for rowid, note in merged_notes.items()])
+        if duplicates:
+            print(warn_text(f"Removed {len(duplicates)} duplicated phrases"
+                            + (f", keeping the notes of {len(merged_notes)}." if merged_notes else ".")))
+    cursor.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_{TABLE_NAME}_phrase_key ON {TABLE_NAME} (phrase_key)")
+
+def migrate_add_sync_tables(conn):
+    cursor = conn.cursor()
+    if 'updated_at' not in get_table_columns(cursor, TABLE_NAME):
+        cursor.execute(f"ALTER TABLE {TABLE_NAME} ADD COLUMN updated_at REAL")
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{TABLE_NAME}_updated_at ON {TABLE_NAME} (updated_at)")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS sync_tombstones (
+    phrase_key TEXT PRIMARY KEY,
+    phrase TEXT,
+    deleted_at REAL
+    )
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+    )
+    """)
+
+def migrate_typed_columns(conn):
+    # Move from JSON-encoded text columns to plain columns, with the examples
+    # in a child table. Row ids are kept, so the insertion order survives.
+    conn.execute(f"ALTER TABLE {TABLE_NAME} RENAME TO {TABLE_NAME}_legacy")
+    conn.execute(f"DROP INDEX IF EXISTS idx_{TABLE_NAME}_phrase_key")
+    conn.execute(f"DROP INDEX IF EXISTS idx_{TABLE_NAME}_updated_at")
+    conn.execute(f"""
+    CREATE TABLE {TABLE_NAME} (
+    id INTEGER PRIMARY KEY,
+    phrase TEXT NOT NULL,
+    phrase_key TEXT NOT NULL,
+    explanation TEXT NOT NULL DEFAULT '',
+    note TEXT,
+    created_at REAL,
+    updated_at REAL
+    )
+    """)
+    conn.execute(f"""
+    CREATE TABLE {EXAMPLES_TABLE_NAME} (
+    phrase_id INTEGER NOT NULL REFERENCES {TABLE_NAME} (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    example TEXT NOT NULL,
+    translation TEXT NOT NULL,
+    PRIMARY KEY (phrase_id, position)
+    )
+    """)
+    now = time.time()
+    rows = []
+    examples = []
+    cursor = conn.execute(f"""
+    SELECT rowid, phases, explanations, examples, translations, notes, phrase_key, updated_at
+    FROM {TABLE_NAME}_legacy ORDER BY rowid
+    """)
+    for rowid, phase, explanation, example, translation, note, phrase_key, updated_at in cursor:
+        stamp = updated_at if updated_at is not None else now
+        rows.append((rowid, json.loads(phase), phrase_key, json.loads(explanation),
+                     json.loads(note) if note is not None else None, stamp, updated_at))
+        for position, pair in enumerate(zip(json.loads(example), json.loads(translation))):
+            examples.append((rowid, position) + pair)
+    conn.executemany(f"""
+    INSERT INTO {TABLE_NAME} (id, phrase, phrase_key, explanation, note, created_at, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, rows)
+    conn.executemany(f"INSERT INTO {EXAMPLES_TABLE_NAME} (phrase_id, position, example, translation) VALUES (?, ?, ?, ?)", examples)
+    conn.execute(f"DROP TABLE {TABLE_NAME}_legacy")
+    conn.execute(f"CREATE UNIQUE INDEX idx_{TABLE_NAME}_phrase_key ON {TABLE_NAME} (phrase_key)")
+    conn.execute(f"CREATE INDEX idx_{TABLE_NAME}_updated_at ON {TABLE_NAME} (updated_at)")
+
+FTS_EXAMPLES_SQL = f"""
+(SELECT group_concat(cjk_split(example || ' ' || translation), ' ')
+FROM {EXAMPLES_TABLE_NAME} WHERE phrase_id = {{0}})
+"""
+
+def migrate_add_fts(conn):
+    # A full-text index over phrases, explanations, notes and examples, kept
+    # in sync by triggers. Skipped when SQLite is built without FTS5, in
+    # which case search_records falls back to LIKE.
+    try:
+        conn.execute(f"""
+        CREATE VIRTUAL TABLE {FTS_TABLE_NAME} USING fts5 (
+        phrase, explanation, note, examples, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+        )
+        """)
+    except sqlite3.OperationalError:
+        return
+    conn.execute(f"""
+    INSERT INTO {FTS_TABLE_NAME} (rowid, phrase, explanation, note, examples)
+    SELECT id, cjk_split(phrase), cjk_split(explanation), cjk_split(note), {FTS_EXAMPLES_SQL.format("id")}
+    FROM {TABLE_NAME}
+    """)
+    conn.execute(f"""
+    CREATE TRIGGER {FTS_TABLE_NAME}_insert AFTER INSERT ON {TABLE_NAME} BEGIN
+    INSERT INTO {FTS_TABLE_NAME} (rowid, phrase, explanation, note, examples)
+    VALUES (new.id, cjk_split(new.phrase), cjk_split(new.explanation), cjk_split(new.note), '');
+    END
+    """)
+    conn.execute(f"""
+    CREATE TRIGGER {FTS_TABLE_NAME}_update AFTER UPDATE ON {TABLE_NAME} BEGIN
+    UPDATE {FTS_TABLE_NAME} SET phrase = cjk_split(new.phrase), explanation = cjk_split(new.explanation),
+    note = cjk_split(new.note) WHERE rowid = new.id;
+    END
+    """)
+    conn.execute(f"""
+    CREATE TRIGGER {FTS_TABLE_NAME}_delete AFTER DELETE ON {TABLE_NAME} BEGIN
+    DELETE FROM {FTS_TABLE_NAME} WHERE rowid = old.id;
+    END
+    """)
+    for event, row in [('INSERT', 'new'), ('DELETE', 'old')]:
+        conn.execute(f"""
+        CREATE TRIGGER {FTS_TABLE_NAME}_examples_{event.lower()} AFTER {event} ON {EXAMPLES_TABLE_NAME} BEGIN
+        UPDATE {FTS_TABLE_NAME} SET examples = {FTS_EXAMPLES_SQL.format(row + ".phrase_id")}
+        WHERE rowid = {row}.phrase_id;
+        END
+        """)
+
+def migrate_add_lemma_key(conn):
+    conn.execute(f"ALTER TABLE {TABLE_NAME} ADD COLUMN lemma_key TEXT")
+    rows = conn.execute(f"SELECT id, phrase FROM {TABLE_NAME}").fetchall()
+    conn.executemany(f"UPDATE {TABLE_NAME} SET lemma_key = ? WHERE id = ?",
+                     [(lemmatize_phrase(phrase), id) for id, phrase in rows])
+    conn.execute(f"CREATE INDEX idx_{TABLE_NAME}_lemma_key ON {TABLE_NAME} (lemma_key)")
+
+def migrate_deferrable_fts_inserts(conn):
+    # Bulk imports skip the per-row insert triggers and index the whole
+    # batch in one statement (see index_fts_rows).
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (FTS_TABLE_NAME, )).fetchone():
+        return
+    conn.execute(f"DROP TRIGGER {FTS_TABLE_NAME}_insert")
+    conn.execute(f"""
+    CREATE TRIGGER {FTS_TABLE_NAME}_insert AFTER INSERT ON {TABLE_NAME} WHEN NOT fts_deferred() BEGIN
+    INSERT INTO {FTS_TABLE_NAME} (rowid, phrase, explanation, note, examples)
+    VALUES (new.id, cjk_split(new.phrase), cjk_split(new.explanation), cjk_split(new.note), '');
+    END
+    """)
+    conn.execute(f"DROP TRIGGER {FTS_TABLE_NAME}_examples_insert")
+    conn.execute(f"""
+    CREATE TRIGGER {FTS_TABLE_NAME}_examples_insert AFTER INSERT ON {EXAMPLES_TABLE_NAME} WHEN NOT fts_deferred() BEGIN
+    UPDATE {FTS_TABLE_NAME} SET examples = {FTS_EXAMPLES_SQL.format("new.phrase_id")}
+    WHERE rowid = new.phrase_id;
+    END
+    """)
+
+def migrate_add_review_schedule(conn):
+    # SM-2 state of every example that has been reviewed at least once.
+    # Keyed by position rather than by example row, so rewriting a phrase's
+    # examples during sync keeps its progress.
+    conn.execute(f"""
+    CREATE TABLE {REVIEW_TABLE_NAME} (
+    phrase_id INTEGER NOT NULL REFERENCES {TABLE_NAME} (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    ease REAL NOT NULL,
+    interval REAL NOT NULL,
+    repetitions INTEGER NOT NULL,
+    due REAL NOT NULL,
+    reviewed_at REAL NOT NULL,
+    PRIMARY KEY (phrase_id, position)
+    )
+    """)
+    conn.execute(f"CREATE INDEX idx_{REVIEW_TABLE_NAME}_due ON {REVIEW_TABLE_NAME} (due)")
+
+def migrate_add_vocabulary_counts(conn):
+    # Row counts of the vocabulary and of its exercises (one per example),
+    # kept current by triggers so that they never need a table scan.
+    conn.execute(f"CREATE TABLE {COUNTS_TABLE_NAME} (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+    for name, table in [('phrases', TABLE_NAME), ('exercises', EXAMPLES_TABLE_NAME)]:
+        conn.execute(f"INSERT INTO {COUNTS_TABLE_NAME} (name, value) SELECT ?, COUNT(*) FROM {table}", (name, ))
+        for event, delta in [('INSERT', '+ 1'), ('DELETE', '- 1')]:
+            conn.execute(f"""
+            CREATE TRIGGER {table}_count_{event.lower()} AFTER {event} ON {table} BEGIN
+            UPDATE {COUNTS_TABLE_NAME} SET value = value {delta} WHERE name = '{name}';
+            END
+            """)
+
+def migrate_add_lookup_queue(conn):
+    # Phrases waiting to be looked up in the background (see LookupQueueWorker).
+    # A phrase leaves the queue once it is in the vocabulary book.
+    conn.execute(f"""
+    CREATE TABLE {QUEUE_TABLE_NAME} (
+    phrase_key TEXT PRIMARY KEY,
+    phrase TEXT NOT NULL,
+    queued_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT
+    )
+    """)
+    conn.execute(f"CREATE INDEX idx_{QUEUE_TABLE_NAME}_next_attempt_at ON {QUEUE_TABLE_NAME} (next_attempt_at)")
+
+def migrate_refresh_lemma_keys(conn):
+    # stem_word now strips the "d" of "-eed" verbs (agreed -> agree)
+    rows = conn.execute(f"SELECT id, phrase, lemma_key FROM {TABLE_NAME}").fetchall()
+    conn.executemany(f"UPDATE {TABLE_NAME} SET lemma_key = ? WHERE id = ?",
+                     [(lemmatize_phrase(phrase), id) for id, phrase, lemma_key in rows
+                      if lemmatize_phrase(phrase) != lemma_key])
+
+def index_fts_rows(conn, ids, replaced=()):
+    """Adds full-text rows for phrases inserted while FTS triggers were deferred.
+
+    replaced are phrases that already had a full-text row but got new
+    examples, whose examples column is rebuilt.
+    """
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (FTS_TABLE_NAME, )).fetchone():
+        return
+    if replaced:
+        placeholders = ','.join('?' * len(replaced))
+        conn.execute(f"""
+        UPDATE {FTS_TABLE_NAME} SET examples = {FTS_EXAMPLES_SQL.format(FTS_TABLE_NAME + ".rowid")}
+        WHERE rowid IN ({placeholders})
+        """, list(replaced))
+    placeholders = ','.join('?' * len(ids))
+    conn.execute(f"""
+    INSERT INTO {FTS_TABLE_NAME} (rowid, phrase, explanation, note, examples)
+    SELECT id, cjk_split(phrase), cjk_split(explanation), cjk_split(note), {FTS_EXAMPLES_SQL.format("id")}
+    FROM {TABLE_NAME} WHERE id IN ({placeholders})
+    """, ids)
+
+VOCABULARY_MIGRATIONS = [
+    migrate_create_vocabulary,
+    migrate_add_phrase_key,
+    migrate_add_sync_tables,
+    migrate_typed_columns,
+    migrate_add_fts,
+    migrate_add_lemma_key,
+    migrate_deferrable_fts_inserts,
+    migrate_add_review_schedule,
+    migrate_add_vocabulary_counts,
+    migrate_add_lookup_queue,
+    migrate_refresh_lemma_keys,
+]
+
+def migrate_create_gpt_cache(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS gpt_cache (
+    key TEXT PRIMARY KEY,
+    response TEXT,
+    created_at REAL,
+    accessed_at REAL
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_gpt_cache_accessed_at ON gpt_cache (accessed_at)")
+
+GPT_CACHE_MIGRATIONS = [
+    migrate_create_gpt_cache,
+]
 
-    print("Table created successfully!")
-    update_database()
+def init_db():
+    # opening the connection brings the schema up to date
+    get_db_conn()
     
 def edit_note_of_phase():
     pass
 
-def find_existing_record(voc):
-    phase = json.dumps(voc)
-    
-    # Connect to the database
-    conn = get_db_conn()
+def normalize_phrase(voc):
+    # "Take off", "take off " and "take  off" share one lookup key
+    voc = unicodedata.normalize('NFKC', voc).casefold()
+    return ' '.join(voc.split())
 
-    # Create a cursor object
-    cursor = conn.cursor()
-    sql = f"SELECT * FROM {TABLE_NAME} where phases = ?"
-    # Execute the SELECT statement
-    cursor.execute(sql, (phase, ))
+def iter_records(where="", params=(), order="v.id", limit=None, cursor=None, join=""):
+    """Yields Records with their examples, in the given order.
 
-    # Fetch all records at once using fetchall()
-    all_records = cursor.fetchall()
-    if len(all_records) == 0:
-        return None
+    where and order are SQL fragments over the vocabulary table aliased v,
+    and over any table that join adds; limit counts phrases, not examples.
+    """
+    if cursor is None:
+        cursor = get_db_conn().cursor()
+    where = "WHERE " + where if where else ""
+    if limit is None:
+        source = f"{TABLE_NAME} v {join}"
     else:
-        return all_records[0]
-    
-    
+        source = f"(SELECT v.* FROM {TABLE_NAME} v {join} {where} ORDER BY {order} LIMIT {int(limit)}) v {join}"
+        where = ""
+    cursor.execute(f"""
+    SELECT v.id, v.phrase, v.explanation, v.note, e.example, e.translation
+    FROM {source} LEFT JOIN {EXAMPLES_TABLE_NAME} e ON e.phrase_id = v.id
+    {where}
+    ORDER BY {order}, e.position
+    """, params)
+    for _, rows in groupby(cursor, key=lambda row: row[0]):
+        rows = list(rows)
+        id, phrase, explanation, note = rows[0][:4]
+        examples = [row[4] for row in rows if row[4] is not None]
+        translations = [row[5] for row in rows if row[4] is not None]
+        yield Record(phrase, explanation, examples, translations, note or "", id)
+
+def build_fts_query(query):
+    # every word must match; latin words as prefixes, CJK characters as a phrase
+    terms = []
+    for word in query.split():
+        word = word.replace('"', '""')
+        if CJK_PATTERN.search(word):
+            terms.append('"' + ' '.join(cjk_split(word).split()) + '"')
+        else:
+            terms.append('"' + word + '"*')
+    return ' '.join(terms)
+
+@traced('db')
+def search_records(query, limit=20):
+    """Returns the Records best matching the query, best first."""
+    conn = get_db_conn()
+    if not query.strip():
+        return []
+    has_fts = conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (FTS_TABLE_NAME, )).fetchone()
+    if has_fts:
+        # bm25 weights: phrase, explanation, note, examples
+        cursor = conn.execute(f"""
+        SELECT rowid FROM {FTS_TABLE_NAME} WHERE {FTS_TABLE_NAME} MATCH ?
+        ORDER BY bm25({FTS_TABLE_NAME}, 10.0, 2.0, 5.0, 1.0) LIMIT ?
+        """, (build_fts_query(query), limit))
+    else:
+        pattern = f"%{query.strip()}%"
+        cursor = conn.execute(f"""
+        SELECT id FROM {TABLE_NAME} WHERE phrase LIKE ? OR explanation LIKE ? OR note LIKE ? LIMIT ?
+        """, (pattern, pattern, pattern, limit))
+    ids = [row[0] for row in cursor.fetchall()]
+    if not ids:
+        return []
+    records = {record.id: record for record in iter_records(f"v.id IN ({', '.join('?' * len(ids))})", ids)}
+    return [records[id] for id in ids if id in records]
+
+def show_search():
+    global __in_main_menu
+    __in_main_menu = False
+    query = get_input("Search words (phrases, explanations, examples, notes)")
+    results = search_records(query)
+    if not results:
+        print(error_text("Nothing found."))
+        wait_for_enter_key()
+        return
+    options = [f"{record.phrase} - {record.explanation[:60]}" for record in results] + ['Back']
+    while True:
+        clear_console()
+        print(success_text(f"{len(results)} results for: ") + query)
+        choice = options.index(get_selection(options, "Open"))
+        if choice == len(results):
+            return
+        clear_console()
+        show_record(None, results[choice], None, from_search=True)
+        wait_for_enter_key()
+
+IRREGULAR_WORDS = {
+    'am': 'be', 'is': 'be', 'are': 'be', 'was': 'be', 'were': 'be', 'been': 'be', 'being': 'be',
+    'has': 'have', 'had': 'have', 'having': 'have', 'does': 'do', 'did': 'do', 'done': 'do', 'doing': 'do',
+    'goes': 'go', 'went': 'go', 'gone': 'go', 'going': 'go',
+    'gave': 'give', 'given': 'give', 'took': 'take', 'taken': 'take', 'came': 'come', 'got': 'get',
+    'gotten': 'get', 'made': 'make', 'brought': 'bring', 'thought': 'think', 'caught': 'catch',
+    'bought': 'buy', 'fought': 'fight', 'kept': 'keep', 'left': 'leave', 'put': 'put', 'set': 'set',
+    'ran': 'run', 'saw': 'see', 'seen': 'see', 'told': 'tell', 'said': 'say', 'held': 'hold',
+    'stood': 'stand', 'broke': 'break', 'broken': 'break', 'fell': 'fall', 'fallen': 'fall',
+    'wore': 'wear', 'worn': 'wear', 'turned': 'turn', 'ate': 'eat', 'eaten': 'eat', 'drew': 'draw',
+    'drawn': 'draw', 'threw': 'throw', 'thrown': 'throw', 'spoke': 'speak', 'spoken': 'speak',
+    'wrote': 'write', 'written': 'write', 'grew': 'grow', 'grown': 'grow', 'found': 'find',
+    'paid': 'pay', 'laid': 'lay', 'sent': 'send', 'spent': 'spend', 'built': 'build', 'felt': 'feel',
+    'met': 'meet', 'sat': 'sit', 'won': 'win', 'lost': 'lose', 'shook': 'shake', 'shaken': 'shake',
+    'rode': 'ride', 'ridden': 'ride', 'rose': 'rise', 'risen': 'rise', 'drove': 'drive', 'driven': 'drive',
+    'children': 'child', 'men': 'man', 'women': 'woman', 'feet': 'foot', 'teeth': 'tooth', 'mice': 'mouse',
+}
+
+# base forms ending in "eed", which are not "-ed" or "-d" inflections
+EED_WORDS = {'bleed', 'breed', 'creed', 'exceed', 'greed', 'indeed', 'proceed', 'speed', 'steed', 'succeed', 'tweed'}
+
+def stem_word(word):
+    # A light, rule-based inflection stripper. The result is only a
+    # signature: "gives", "gave" and "giving" must agree, not be real words.
+    word = IRREGULAR_WORDS.get(word, word)
+    if len(word) <= 3:
+        pass
+    elif word.endswith('ies') and len(word) > 4:
+        word = word[:-3] + 'y'
+    elif word.endswith(('sses', 'shes', 'ches', 'xes', 'zes')):
+        word = word[:-2]
+    elif word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        word = word[:-1]
+    elif word.endswith('ied') and len(word) > 4:
+        word = word[:-3] + 'y'
+    elif word.endswith('eed'):
+        # agreed -> agree, but need and feed stay
+        if len(word) > 4 and word not in EED_WORDS:
+            word = word[:-1]
+    else:
+        for suffix in ('ing', 'ed'):
+            stem = word[:-len(suffix)]
+            if word.endswith(suffix) and re.search('[aeiouy]', stem):
+                word = stem
+                # running -> run, stopped -> stop
+                if len(word) > 3 and word[-1] == word[-2] and word[-1] not in 'lsz':
+                    word = word[:-1]
+                break
+    if word.endswith('e') and len(word) > 2:
+        word = word[:-1]
+    if word.endswith('y'):
+        word = word[:-1] + 'i'
+    return word
+
+def lemmatize_phrase(voc):
+    words = re.findall(r"[\w']+", normalize_phrase(voc))
+    if len(words) > 1 and words[0] == 'to':
+        words = words[1:]
+    return ' '.join(stem_word(word) for word in words)
+
+@traced('db')
+def find_similar_record(voc):
+    """Finds a stored phrase that only differs from voc by inflection."""
+    phrase_key = normalize_phrase(voc)
+    for record in iter_records("v.lemma_key = ? AND v.phrase_key != ?", (lemmatize_phrase(voc), phrase_key), limit=1):
+        return record
+    return None
+
+@traced('db')
+def find_existing_record(voc):
+    for record in iter_records("v.phrase_key = ?", (normalize_phrase(voc), )):
+        return record
+    return None
     
-def get_results(voc):
+def get_results(voc, on_token=None):
     record = find_existing_record(voc)
     if record is not None:
         show_record(None, record, None, from_search=True)
         return None
+    record = find_similar_record(voc)
+    if record is not None:
+        print(warn_text(f"\"{record.phrase}\" is already in your vocabulary book."))
+        options = ["Show it", "Look up anyway"]
+        if get_selection(options, "What do you want to do?") != options[1]:
+            show_record(None, record, None, from_search=True)
+            return None
+    return lookup_phrase(voc, on_token=on_token)
+
+def repair_json(answer):
+    """Parses the JSON object in a ChatGPT answer, even when it is wrapped in
+    code fences or prose, or has trailing commas."""
+    try:
+        return json.loads(answer, strict=False)
+    except ValueError:
+        pass
+    start, end = answer.find('{'), answer.rfind('}')
+    if start == -1 or end < start:
+        raise ValueError("ChatGPT did not answer with a JSON object")
+    text = answer[start:end + 1]
+    try:
+        return json.loads(text, strict=False)
+    except ValueError:
+        return json.loads(re.sub(r',\s*([}\]])', r'\1', text), strict=False)
+
+def parse_lookup_answer(answer):
+    output_json = repair_json(answer)
+    if not isinstance(output_json, dict):
+        raise ValueError("ChatGPT did not answer with a JSON object")
+    if 'example sentences' not in output_json:
+        # a model that prefers identifiers may rename the field
+        output_json['example sentences'] = output_json.pop('example_sentences', None) or output_json.pop('examples', None)
+    if not isinstance(output_json.get('explanation'), str) or not isinstance(output_json['example sentences'], list) \
+            or not isinstance(output_json.get('translations'), list):
+        raise ValueError("ChatGPT's answer is missing fields")
+    return output_json
+
+def lookup_phrase(voc, on_token=None, quiet=False):
+    prompt = f'Explain "{voc}". Give 3 example sentences and their Chinese translations.'
+    options = {'system': LOOKUP_SYSTEM_PROMPT, 'function': LOOKUP_FUNCTION, 'parse': parse_lookup_answer, 'quiet': quiet}
+    try:
+        output_json = chat_with_gpt(prompt, on_token=on_token, **options)
+    except ValueError:
+        # repair_json could not save the answer; ask once more
+        output_json = chat_with_gpt(prompt, **options)
+    if output_json is None:
+        raise ValueError("ChatGPT did not answer")
+    return output_json
+
+def read_phrase_list(path):
+    """Reads one phrase per line from a file, or from stdin when path is '-'."""
+    if path == '-':
+        lines = sys.stdin.readlines()
     else:
-        answer = chat_with_gpt(f"Explain the meaning of {voc} in simple words. And give 3 example sentences as well as the translations of these 3 example sentences in Chinese. The output should be a JSON following the format below:\n{example}")
-        output_json = json.loads(answer)
-        return output_json
+        with open(path, 'r', encoding='utf-8') as f:
+            lines = f.readlines()
+    return [line.strip() for line in lines if line.strip() != '' and not line.startswith('#')]
 
+def batch_lookup(vocs, concurrency=BATCH_LOOKUP_CONCURRENCY, force=False):
+    """Looks up every phrase in vocs and stores the answers.
+
+    Inflected forms of a stored or already listed phrase are skipped and
+    listed with their match, unless force is set.
+    """
+    from tqdm.auto import tqdm
+    start = time.perf_counter()
+    seen = set()
+    listed = {}
+    todo = []
+    skipped = 0
+    inflections = []
+    for voc in vocs:
+        voc = ' '.join(voc.split())
+        phrase_key = normalize_phrase(voc)
+        if phrase_key in seen or find_existing_record(voc) is not None:
+            skipped += 1
+            continue
+        seen.add(phrase_key)
+        if not force:
+            lemma_key = lemmatize_phrase(voc)
+            match = listed.get(lemma_key)
+            if match is None:
+                record = find_similar_record(voc)
+                match = record.phrase if record is not None else None
+            if match is not None:
+                inflections.append((voc, match))
+                continue
+            listed[lemma_key] = voc
+        todo.append(voc)
+
+    inserted = 0
+    failed = []
+    batch = []
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        # quiet: errors are listed once the progress bar is done
+        futures = {pool.submit(lookup_phrase, voc, quiet=True): voc for voc in todo}
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            voc = futures[future]
+            try:
+                batch.append((voc, future.result(), None))
+            except Exception as e:
+                failed.append((voc, str(e)))
+            if len(batch) >= BATCH_INSERT_SIZE:
+                inserted += insert_records(batch)
+                batch = []
+    inserted += insert_records(batch)
+
+    elapsed = time.perf_counter() - start
+    print(success_text(f"Added {inserted} phrases in {elapsed:.2f}s ({inserted / max(elapsed, 1e-6):.1f} phrases/s)"))
+    if skipped:
+        print(f"Skipped {skipped} phrases that are already in the vocabulary book or repeated.")
+    if inflections:
+        print(warn_text(f"Skipped {len(inflections)} phrases that look like forms of another one "
+                        "(pass --force, or choose \"Look them up anyway\", to include them):"))
+        for voc, match in inflections:
+            print(f"  {voc} -> {match}")
+    for voc, message in failed:
+        print(error_text(f"Failed to look up {voc}: {message}"))
+    if inserted:
+        backup_vocabulary()
+    return inserted
+
+@traced('db')
+def queue_lookup(voc, force=False):
+    """Queues voc for the background worker.
+
+    Returns the matching Record instead when the phrase, or an inflected
+    form of it, is already in the vocabulary book. force only skips the
+    inflection check, which has false positives ("left" for "leave").
+    """
+    voc = ' '.join(voc.split())
+    record = find_existing_record(voc) or (None if force else find_similar_record(voc))
+    if record is not None:
+        return record
+    now = time.time()
+    conn = get_db_conn()
+    with conn:
+        # queueing a phrase again gives it a fresh set of attempts
+        conn.execute(f"""
+        INSERT INTO {QUEUE_TABLE_NAME} (phrase_key, phrase, queued_at, next_attempt_at) VALUES (?, ?, ?, ?)
+        ON CONFLICT (phrase_key) DO UPDATE SET attempts = 0, next_attempt_at = excluded.next_attempt_at, last_error = NULL
+        """, (normalize_phrase(voc), voc, now, now))
+    wake_lookup_worker()
+    return None
+
+@traced('db')
+def next_queued_lookup(now):
+    """Returns (phrase_key, phrase, attempts) of the queued phrase due first, or None."""
+    cursor = get_db_conn().execute(f"""
+    SELECT phrase_key, phrase, attempts FROM {QUEUE_TABLE_NAME}
+    WHERE next_attempt_at <= ? AND attempts < ? ORDER BY next_attempt_at LIMIT 1
+    """, (now, LOOKUP_QUEUE_MAX_ATTEMPTS))
+    return cursor.fetchone()
+
+def next_lookup_attempt_at():
+    cursor = get_db_conn().execute(f"SELECT MIN(next_attempt_at) FROM {QUEUE_TABLE_NAME} WHERE attempts < ?",
+                                   (LOOKUP_QUEUE_MAX_ATTEMPTS, ))
+    return cursor.fetchone()[0]
+
+@traced('db')
+def finish_queued_lookup(phrase_key, error=None, retry_at=None):
+    """Drops a looked up phrase from the queue, or records a failed attempt."""
+    conn = get_db_conn()
+    with conn:
+        if error is None:
+            conn.execute(f"DELETE FROM {QUEUE_TABLE_NAME} WHERE phrase_key = ?", (phrase_key, ))
+        else:
+            conn.execute(f"""
+            UPDATE {QUEUE_TABLE_NAME} SET attempts = attempts + 1, next_attempt_at = ?, last_error = ?
+            WHERE phrase_key = ?
+            """, (retry_at, error, phrase_key))
+
+@traced('db')
+def get_lookup_queue_status():
+    """Returns the number of (pending, failed) queued phrases and the latest error, if any."""
+    conn = get_db_conn()
+    pending, failed = conn.execute(f"""
+    SELECT COALESCE(SUM(attempts < ?), 0), COALESCE(SUM(attempts >= ?), 0) FROM {QUEUE_TABLE_NAME}
+    """, (LOOKUP_QUEUE_MAX_ATTEMPTS, LOOKUP_QUEUE_MAX_ATTEMPTS)).fetchone()
+    # the worker never prints, its errors are only shown here
+    row = conn.execute(f"""
+    SELECT phrase, last_error FROM {QUEUE_TABLE_NAME} WHERE last_error IS NOT NULL
+    ORDER BY next_attempt_at DESC LIMIT 1
+    """).fetchone()
+    last_error = f"{row[0]}: {row[1]}" if row is not None else None
+    return pending, failed, last_error
+
+class LookupQueueWorker(threading.Thread):
+    """Looks up queued phrases one at a time, in the background.
+
+    The worker is bound to the vocabulary book that was open when it
+    started and stops as soon as another user logs in.
+    """
+    def __init__(self):
+        super().__init__(name="lookup-queue", daemon=True)
+        self.db_path = get_db_path()
+        self.wake = threading.Event()
+        self.stopped = threading.Event()
+
+    def stop(self):
+        self.stopped.set()
+        self.wake.set()
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                delay = self.lookup_next()
+            except sqlite3.Error:
+                delay = LOOKUP_QUEUE_RETRY_DELAY
+            if delay > 0:
+                self.wake.wait(delay)
+                self.wake.clear()
+
+    def lookup_next(self):
+        # returns how long to sleep before looking at the queue again
+        now = time.time()
+        item = next_queued_lookup(now)
+        if item is None:
+            next_attempt_at = next_lookup_attempt_at()
+            if next_attempt_at is None:
+                return LOOKUP_QUEUE_IDLE_DELAY
+            return min(LOOKUP_QUEUE_IDLE_DELAY, max(1, next_attempt_at - now))
+        phrase_key, voc, attempts = item
+        try:
+            # quiet: anything printed here would land on top of the prompt in front
+            output_json = lookup_phrase(voc, quiet=True)
+            error = None
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        if self.stopped.is_set() or get_db_path() != self.db_path:
+            self.stopped.set()
+            return 0
+        if error is None:
+            insert_records([(voc, output_json, None)])
+            finish_queued_lookup(phrase_key)
+        else:
+            retry_at = time.time() + min(LOOKUP_QUEUE_MAX_DELAY, LOOKUP_QUEUE_RETRY_DELAY * 2 ** attempts)
+            finish_queued_lookup(phrase_key, error, retry_at)
+        return 0
+
+def start_lookup_worker():
+    global __lookup_worker
+    if __lookup_worker is not None and __lookup_worker.is_alive() and __lookup_worker.db_path == get_db_path():
+        __lookup_worker.wake.set()
+        return
+    stop_lookup_worker()
+    __lookup_worker = LookupQueueWorker()
+    __lookup_worker.start()
+
+def wake_lookup_worker():
+    if __lookup_worker is not None:
+        __lookup_worker.wake.set()
+
+def stop_lookup_worker():
+    global __lookup_worker
+    if __lookup_worker is not None:
+        __lookup_worker.stop()
+        # let a write in progress finish before the connections get closed
+        __lookup_worker.join(LOOKUP_WORKER_STOP_TIMEOUT)
+        __lookup_worker = None
+
+atexit.register(stop_lookup_worker)
+
+def queue_for_later():
+    print("Type the phrases to look up in the background, one at a time. Leave it empty when you are done.")
+    while True:
+        voc = get_input("Phrase", validate=False).strip()
+        if voc == '':
+            return
+        record = queue_lookup(voc)
+        if record is not None and normalize_phrase(record.phrase) != normalize_phrase(voc):
+            print(warn_text(f"\"{record.phrase}\" is already in your vocabulary book."))
+            options = ["Skip it", "Queue anyway"]
+            if get_selection(options, "What do you want to do?") == options[1]:
+                record = queue_lookup(voc, force=True)
+        if record is None:
+            print(success_text(f"Queued: {voc}"))
+        else:
+            print(warn_text(f"Already in your vocabulary book: {record.phrase}"))
+
+@traced('db')
+def write_records(conn, rows, updated_at, replace=False):
+    """Writes (phrase, explanation, examples, translations, note) rows with a few statements.
+
+    This is the one write path of the vocabulary book, shared by lookups,
+    sync and import. Phrases already in the book are left alone unless
+    replace is set, and only the first of any repeated phrase is kept (the
+    last with replace). The full-text rows are built once for the batch
+    instead of by the per-row triggers. Runs inside the caller's
+    transaction; returns how many phrases were written.
+    """
+    batch = {}
+    for row in rows:
+        if replace:
+            batch[normalize_phrase(row[0])] = row
+        else:
+            batch.setdefault(normalize_phrase(row[0]), row)
+    if not batch:
+        return 0
+    placeholders = ','.join('?' * len(batch))
+    existing = dict(conn.execute(
+        f"SELECT phrase_key, id FROM {TABLE_NAME} WHERE phrase_key IN ({placeholders})", list(batch)))
+    rows = [(row, key) for key, row in batch.items() if replace or key not in existing]
+    if not rows:
+        return 0
+    __fts_deferred.active = True
+    try:
+        conn.executemany(f"""
+        INSERT INTO {TABLE_NAME} (phrase, phrase_key, lemma_key, explanation, note, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (phrase_key) DO UPDATE SET
+        explanation = excluded.explanation, note = excluded.note, updated_at = excluded.updated_at
+        """, [(phrase, key, lemmatize_phrase(phrase), explanation, note, updated_at, updated_at)
+              for (phrase, explanation, _, _, note), key in rows])
+        new_keys = [key for _, key in rows]
+        placeholders = ','.join('?' * len(new_keys))
+        ids = dict(conn.execute(
+            f"SELECT phrase_key, id FROM {TABLE_NAME} WHERE phrase_key IN ({placeholders})", new_keys))
+        replaced = [ids[key] for key in new_keys if key in existing]
+        conn.executemany(f"DELETE FROM {EXAMPLES_TABLE_NAME} WHERE phrase_id = ?", [(id, ) for id in replaced])
+        # review progress is kept by position, minus the positions that are gone
+        conn.executemany(f"DELETE FROM {REVIEW_TABLE_NAME} WHERE phrase_id = ? AND position >= ?",
+                         [(ids[key], min(len(examples), len(translations)))
+                          for (_, _, examples, translations, _), key in rows if key in existing])
+        conn.executemany(f"INSERT INTO {EXAMPLES_TABLE_NAME} (phrase_id, position, example, translation) VALUES (?, ?, ?, ?)",
+                         [(ids[key], position, example, translation)
+                          for (_, _, examples, translations, _), key in rows
+                          for position, (example, translation) in enumerate(zip(examples, translations))])
+        conn.executemany("DELETE FROM sync_tombstones WHERE phrase_key = ?", [(key, ) for key in new_keys])
+        conn.executemany(f"DELETE FROM {QUEUE_TABLE_NAME} WHERE phrase_key = ?", [(key, ) for key in new_keys])
+        index_fts_rows(conn, [ids[key] for key in new_keys if key not in existing], replaced)
+    finally:
+        __fts_deferred.active = False
+    return len(rows)
+
+@traced('db')
 def insert_record(voc, output_json, note=None, skip_backup=True, skip_message=False):
     if output_json is None:
         return
     try:
-        phase = json.dumps(voc)
-        explanation = json.dumps(output_json['explanation'])
-        example = json.dumps(output_json['example sentences'])
-        translation = json.dumps(output_json['translations'])
-        
         # Connect to the database
         conn = get_db_conn()
-
-        # Create a cursor object
-        cursor = conn.cursor()
-
-        # Define the INSERT statement with placeholders for data
-        if note is None:
-            insert_sql = f"""
-            INSERT INTO vocabulary (phases, explanations, examples, translations)
-            VALUES (?, ?, ?, ?)
-            """
-
-            # Insert data as a tuple
-            data_tuple = (phase, explanation, example, translation)
-        
-        else:
-            insert_sql = f"""
-            INSERT INTO vocabulary (phases, explanations, examples, translations, notes)
-            VALUES (?, ?, ?, ?, ?)
-            """
-            note = json.dumps(note)
-            # Insert data as a tuple
-            data_tuple = (phase, explanation, example, translation, note)
-
-        # Execute the INSERT statement with data tuple
-        cursor.execute(insert_sql, data_tuple)
-
-        # Commit the changes to the database
-        conn.commit()
-
-        # Close the connection
-        conn.close()
+        with conn:
+            inserted = write_records(conn, [(voc, output_json['explanation'], output_json['example sentences'],
+                                             output_json['translations'], note)], time.time())
         if not skip_message:
-            print(success_text(f"Record inserted successfully: {voc}"))
+            if inserted:
+                print(success_text(f"Record inserted successfully: {voc}"))
+            else:
+                print(warn_text(f"Record already exists: {voc}"))
     except sqlite3.Error as e:
         print(error_text("Error inserting record:" + str(e)))
 
     if not skip_backup:
         backup_vocabulary()
         
+@traced('db')
+def insert_records(items, updated_at=None):
+    """Inserts (voc, output_json, note) items in a single transaction.
+
+    Phrases that already exist are skipped. Either every row is written or,
+    if anything goes wrong (including Ctrl-C), none are.
+    """
+    if updated_at is None:
+        updated_at = time.time()
+    rows = [(voc, output_json['explanation'], output_json['example sentences'], output_json['translations'], note)
+            for voc, output_json, note in items]
+    inserted = 0
+    conn = get_db_conn()
+    with conn:
+        for start in range(0, len(rows), IMPORT_BATCH_SIZE):
+            inserted += write_records(conn, rows[start:start + IMPORT_BATCH_SIZE], updated_at)
+    return inserted
+
+@traced('db')
 def update_record_note(voc, note):
-    import requests
     conn = get_db_conn()
     cursor = conn.cursor()
-    condition = f"phases = '{voc}'"
-    update_query = f"UPDATE {TABLE_NAME} SET notes = ? WHERE {condition}"
-    cursor.execute(update_query, (json.dumps(note),))
+    update_query = f"UPDATE {TABLE_NAME} SET note = ?, updated_at = ? WHERE phrase_key = ?"
+    cursor.execute(update_query, (note, time.time(), normalize_phrase(voc)))
     conn.commit()
-    conn.close()
 
     if __cloud_user_email is not None:
-        resp = requests.post(f"{SERVER_ADDR}/edit_note", json={
+        resp = server_post("/edit_note", {
             'email': __cloud_user_email,
-            'phrase': json.loads(voc),
+            'phrase': voc,
             'note': note
         })
-        if resp.ok:
+        if resp is not None and resp.ok:
             data = resp.json()
             success = data['success']
             if not success:
@@ -315,23 +1539,24 @@ def update_record_note(voc, note):
             time.sleep(2)
 
     
+@traced('db')
 def delete_record(voc):
-    import requests
     conn = get_db_conn()
     cursor = conn.cursor()
-    # condition = f"phases = '{voc}'"
-    delete_query = f"DELETE FROM {TABLE_NAME} WHERE phases = ?"
-    print("query", delete_query)
-    cursor.execute(delete_query, (voc, ))
+    phrase_key = normalize_phrase(voc)
+    # the examples go with it through ON DELETE CASCADE
+    delete_query = f"DELETE FROM {TABLE_NAME} WHERE phrase_key = ?"
+    cursor.execute(delete_query, (phrase_key, ))
+    cursor.execute("INSERT OR REPLACE INTO sync_tombstones (phrase_key, phrase, deleted_at) VALUES (?, ?, ?)",
+                   (phrase_key, voc, time.time()))
     conn.commit()
-    conn.close()
 
     if __cloud_user_email is not None:
-        resp = requests.post(f"{SERVER_ADDR}/delete_from_server", json={
+        resp = server_post("/delete_from_server", {
             'email': __cloud_user_email,
-            'phrase': json.loads(voc)
+            'phrase': voc
         })
-        if resp.ok:
+        if resp is not None and resp.ok:
             data = resp.json()
             success = data['success']
             if not success:
@@ -348,11 +1573,7 @@ def edit_record(idx, record, total_num):
     print("Edit now")
     print("================================")
     print(f"{idx + 1} / {total_num}")
-    phase = json.loads(record[0])
-    explanation = json.loads(record[1])
-    examples = json.loads(record[2])
-    translates = json.loads(record[3])
-    note = json.loads(record[4]) if record[4] is not None else ""
+    phase, explanation, examples, translates, note = record[:5]
     print(success_text("Phase: ") + phase)
     print(success_text("Explanation: ") + explanation)
     print("\n" + success_text("Examples: "))
@@ -364,25 +1585,25 @@ def edit_record(idx, record, total_num):
         
     note = get_input("Note", validate=False)
     if note.strip() != '':
-        update_record_note(record[0], note.strip())
+        update_record_note(record.phrase, note.strip())
         print(success_text("Note is updated."))
     options = ['Done', 'Delete']
     idx = options.index(get_selection(options, "Edit Options"))
     if idx == 0:
         return
     elif idx == 1:
-        delete_record(record[0])
+        delete_record(record.phrase)
         print(success_text(f"Record of {phase} is deleted... Back in 3 seconds ..."))
         time.sleep(3)
     
-def evaluate_translation(voc, chinese, english, language="English"):
+def evaluate_translation(voc, chinese, english, language="English", on_token=None, quiet=False):
     if chinese.strip() == "" or english.strip() == "":
         return ""
     prompt = f"This is an sentence making exercise using \"{voc}\"." 
     prompt += f"Given the sentence \"{chinese}\" and the translation \"{english}\", " 
     prompt += f"evaluate the translation, correct any mistakes and recommend any improvements in {language}."
     prompt += f"The evaluation must include \"{voc}\" in it."
-    output = chat_with_gpt(prompt)
+    output = chat_with_gpt(prompt, on_token=on_token, quiet=quiet)
     return output
 
 def show_record(idx, record, total_num, from_search = False, default_option_idx = 0):
@@ -392,11 +1613,7 @@ def show_record(idx, record, total_num, from_search = False, default_option_idx
     print("================================")
     if not from_search:
         print(f"{idx + 1} / {total_num}")
-    phase = json.loads(record[0])
-    explanation = json.loads(record[1])
-    examples = json.loads(record[2])
-    translates = json.loads(record[3])
-    note = json.loads(record[4]) if record[4] is not None else ""
+    phase, explanation, examples, translates, note = record[:5]
     print(success_text("Phase: ") + phase)
     print(success_text("Explanation: ") + explanation)
     print("\n" + success_text("Examples: "))
@@ -411,8 +1628,6 @@ def show_record(idx, record, total_num, from_search = False, default_option_idx
         options = ['Next', 'Prev', 'Practice', 'Edit', 'Back']
         print()
         choice = get_selection(options,'Operation', default_idx = default_option_idx)
-        if choice is None:
-            return
         
         DEFAULT_VIEW_OPTION_IDX = options.index(choice)
         if options.index(choice) == 0:
@@ -420,119 +1635,168 @@ def show_record(idx, record, total_num, from_search = False, default_option_idx
         elif options.index(choice) == 1:
             return idx - 1, None
         elif options.index(choice) == 2:
-            return idx, lambda: practice_phase(record[0], examples, translates)
+            return idx, lambda: practice_phase(phase, examples, translates)
         elif options.index(choice) == 3:
             return idx, lambda: edit_record(idx, record, total_num)
         else:
-            show_menu()
-            return -1, None
+            return None, None
 
     
-def add_column_to_table(table_name, column_name, data_type):
-    conn = get_db_conn()
-    cursor = conn.cursor()
-
-    try:
-        cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {data_type}")
-        conn.commit()
-        print(f"Column '{column_name}' added successfully to database.")
-    except sqlite3.OperationalError as e:
-        print(f"Error adding column: {e}")
-    finally:
-        cursor.close()
-        conn.close()
-        
-def get_all_voc(clear=True, order_option=ListOrderOptions.EARLIST_FIRST):
-    # Connect to the database
-    conn = get_db_conn()
-
-    # Create a cursor object
-    cursor = conn.cursor()
+class RecordBrowser:
+    """Walks the vocabulary book in a fixed order with keyset pagination.
 
-    # Define the SELECT statement to retrieve all columns from all rows
-    select_all_sql = f"""
-    SELECT * FROM {TABLE_NAME}
+    Only one page of records around the current one is kept in memory.
+    The randomized order is a seeded permutation, written once into a
+    TEMP table when the browser opens, so that it stays the same for the
+    whole session and every page is a seek on its positions.
     """
+    PAGE_SIZE = 20
+
+    def __init__(self, order_option, seed=None):
+        if seed is None:
+            seed = random.randrange(1 << 30)
+        self.reverse = False
+        self.join_sql = ""
+        if order_option == ListOrderOptions.RANDOM:
+            self._shuffle(seed)
+            self.join_sql = "JOIN temp.browse_order o ON o.id = v.id"
+            self.key_sql = "(o.pos)"
+            self.order_sql = "o.pos {0}"
+            self.sort_key = self._position
+        elif order_option == ListOrderOptions.LATEST_FIRST:
+            # walking the ids backwards
+            self.reverse = True
+            self.key_sql = "(v.id)"
+            self.order_sql = "v.id {1}"
+            self.sort_key = lambda record: (record.id, )
+        else:
+            self.key_sql = "(v.id)"
+            self.order_sql = "v.id {0}"
+            self.sort_key = lambda record: (record.id, )
+        self.total = get_vocabulary_count('phrases')
+        self.index = 0
+        self.window = self._page()
+        self.pos = 0
+
+    @traced('db')
+    def _shuffle(self, seed):
+        conn = get_db_conn()
+        ids = [id for id, in conn.execute(f"SELECT id FROM {TABLE_NAME} ORDER BY id")]
+        random.Random(seed).shuffle(ids)
+        with conn:
+            conn.execute("DROP TABLE IF EXISTS temp.browse_order")
+            conn.execute("CREATE TEMP TABLE browse_order (pos INTEGER PRIMARY KEY, id INTEGER NOT NULL)")
+            conn.executemany("INSERT INTO temp.browse_order (id) VALUES (?)", ((id, ) for id in ids))
+            # indexed after the fill, which is cheaper than keeping it up to date
+            conn.execute("CREATE UNIQUE INDEX temp.idx_browse_order_id ON browse_order (id)")
+
+    def _position(self, record):
+        row = get_db_conn().execute("SELECT pos FROM temp.browse_order WHERE id = ?", (record.id, )).fetchone()
+        return (row[0], )
+
+    @traced('db')
+    def _page(self, after=None, before=None, last=False):
+        # the page after/before a keyset position, or the first/last page
+        direction = ('DESC', 'ASC') if before is not None or last else ('ASC', 'DESC')
+        key = after if after is not None else before
+        if key is not None:
+            op = '>' if (after is not None) != self.reverse else '<'
+            where = f"{self.key_sql} {op} ({', '.join('?' * len(key))})"
+        else:
+            where, key = "", ()
+        records = list(iter_records(where, key, order=self.order_sql.format(*direction), limit=self.PAGE_SIZE,
+                                    join=self.join_sql))
+        if direction[0] == 'DESC':
+            records.reverse()
+        return records
+
+    def current(self):
+        return self.window[self.pos] if self.window else None
+
+    def next(self):
+        if self.pos + 1 < len(self.window):
+            self.pos += 1
+            self.index += 1
+            return
+        self.window = self._page(after=self.sort_key(self.window[-1]))
+        self.pos = 0
+        self.index += 1
+        if not self.window:
+            # wrap around to the first one
+            self.window = self._page()
+            self.index = 0
+
+    def prev(self):
+        if self.pos > 0:
+            self.pos -= 1
+            self.index -= 1
+            return
+        self.window = self._page(before=self.sort_key(self.window[0]))
+        self.index -= 1
+        if not self.window:
+            # wrap around to the last one
+            self.window = self._page(last=True)
+            self.index = self.total - 1
+        self.pos = len(self.window) - 1
+
+    def refresh(self):
+        """Re-reads just the current record after it was edited or deleted."""
+        record = self.current()
+        fresh = find_record_by_id(record.id)
+        if fresh is not None:
+            self.window[self.pos] = fresh
+            return
+        # deleted: the record that followed it takes its place
+        del self.window[self.pos]
+        self.total -= 1
+        if self.pos >= len(self.window):
+            self.window = self._page(after=self.sort_key(record))
+            self.pos = 0
+            if not self.window:
+                self.window = self._page()
+                self.index = 0
+
+@traced('db')
+def find_record_by_id(id):
+    for record in iter_records("v.id = ?", (id, )):
+        return record
+    return None
 
-    # Execute the SELECT statement
-    cursor.execute(select_all_sql)
-
-    # Fetch all records at once using fetchall()
-    all_records = cursor.fetchall()
-    if order_option == ListOrderOptions.RANDOM:
-        random.shuffle(all_records)
-    elif order_option == ListOrderOptions.LATEST_FIRST:
-        all_records = list(reversed(all_records))
+def get_all_voc(clear=True, order_option=ListOrderOptions.EARLIST_FIRST):
+    browser = RecordBrowser(order_option)
     # Print all records
-    if all_records:
+    if browser.current() is not None:
         print("Records:")
-        # for idx, record in enumerate(all_records):
-        #     show_record(idx, record, len(all_records))
-        idx = 0
-        record = all_records[idx]
-        
         while True:
             if clear:
                 clear_console()
-            next_idx, op = show_record(idx, record, len(all_records), default_option_idx=DEFAULT_VIEW_OPTION_IDX)
+            idx = browser.index
+            next_idx, op = show_record(idx, browser.current(), browser.total, default_option_idx=DEFAULT_VIEW_OPTION_IDX)
+            if next_idx is None:
+                return
             if op is not None:
                 op()
-                cursor.execute(select_all_sql)
-                all_records = cursor.fetchall()
-                if idx < 0:
-                    idx = 0
-                elif idx >= len(all_records):
-                    idx = len(all_records)
-                
-                if order_option == ListOrderOptions.RANDOM:
-                    random.shuffle(all_records)
-                elif order_option == ListOrderOptions.LATEST_FIRST:
-                    all_records = list(reversed(all_records))
-                
-                if len(all_records) == 0:
+                browser.refresh()
+                if browser.current() is None:
                     clear_console()
-                    show_menu()
                     return 
-                
-                record = all_records[idx]
                 clear_console()
-                
-            idx = next_idx
-            if idx == -1:
-                idx = len(all_records) - 1
-            elif idx >= len(all_records):
-                idx = 0
-                
-            record = all_records[idx]
+            elif next_idx > idx:
+                browser.next()
+            elif next_idx < idx:
+                browser.prev()
     else:
         print(error_text("No records found in the table."))
         wait_for_enter_key()
-        show_menu()
-
-    # Close the connection
-    conn.close()
-
-def get_all_records():
-    # Connect to the database
-    conn = get_db_conn()
 
-    # Create a cursor object
-    cursor = conn.cursor()
-
-    # Define the SELECT statement to retrieve all columns from all rows
-    select_all_sql = f"""
-    SELECT * FROM {TABLE_NAME}
-    """
-
-    # Execute the SELECT statement
-    cursor.execute(select_all_sql)
-
-    # Fetch all records at once using fetchall()
-    all_records = cursor.fetchall()
-    return all_records
+@traced('db')
+def get_vocabulary_count(name):
+    """The cached number of 'phrases' or 'exercises' in the vocabulary book."""
+    cursor = get_db_conn().execute(f"SELECT value FROM {COUNTS_TABLE_NAME} WHERE name = ?", (name, ))
+    return cursor.fetchone()[0]
 
 def start_general_practice(review_language='English'):
-    print(success_text("Vocabulary Size: ") + str(len(get_all_records())))
+    print(success_text("Vocabulary Size: ") + str(get_vocabulary_count('phrases')))
     options = ["Warm Up (5 - 10 exercises)", "Standard (11 - 20 exercises)", "Advanced (21 - 40 exercises)", "Challenge (41 - 80 exercises)", "All (all exercises)"]
     idx = options.index(get_selection(options, "How many exercises?"))
     if idx == 0:
@@ -546,74 +1810,220 @@ def start_general_practice(review_language='English'):
     elif idx == 4:
         general_practice(num_questions=-1)
 
-def general_practice(num_questions=-1, review_language='English'):
+EXERCISE_COLUMNS = "v.phrase, v.explanation, e.example, e.translation, COALESCE(v.note, ''), e.phrase_id, e.position"
+
+REVIEW_GRADES = {"Again": 1, "Hard": 3, "Good": 4, "Easy": 5}
+
+def sm2(ease, interval, repetitions, quality):
+    """The SM-2 update; quality runs from 0 (blackout) to 5 (perfect).
+
+    Returns the new (ease, interval in days, repetitions).
+    """
+    if quality < 3:
+        repetitions, interval = 0, 1
+    else:
+        repetitions += 1
+        if repetitions == 1:
+            interval = 1
+        elif repetitions == 2:
+            interval = 6
+        else:
+            interval = round(interval * ease)
+    ease = max(1.3, ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    return ease, interval, repetitions
+
+@traced('db')
+def get_review_exercises(limit, now=None):
+    """Returns up to limit exercises, the most overdue first, topped up with never reviewed ones."""
+    if now is None:
+        now = time.time()
+    conn = get_db_conn()
+    rows = conn.execute(f"""
+    SELECT {EXERCISE_COLUMNS} FROM {REVIEW_TABLE_NAME} s
+    JOIN {EXAMPLES_TABLE_NAME} e ON e.phrase_id = s.phrase_id AND e.position = s.position
+    JOIN {TABLE_NAME} v ON v.id = s.phrase_id
+    WHERE s.due <= ? ORDER BY s.due LIMIT ?
+    """, (now, limit)).fetchall()
+    if len(rows) < limit:
+        rows += conn.execute(f"""
+        SELECT {EXERCISE_COLUMNS} FROM {EXAMPLES_TABLE_NAME} e
+        JOIN {TABLE_NAME} v ON v.id = e.phrase_id
+        WHERE NOT EXISTS (SELECT 1 FROM {REVIEW_TABLE_NAME} s WHERE s.phrase_id = e.phrase_id AND s.position = e.position)
+        ORDER BY e.phrase_id, e.position LIMIT ?
+        """, (limit - len(rows), )).fetchall()
+    return [Exercise(*row) for row in rows]
+
+@traced('db')
+def count_due_reviews(now=None):
+    if now is None:
+        now = time.time()
+    # same join as get_review_exercises, so schedules of removed examples don't count
+    cursor = get_db_conn().execute(f"""
+    SELECT COUNT(*) FROM {REVIEW_TABLE_NAME} s
+    JOIN {EXAMPLES_TABLE_NAME} e ON e.phrase_id = s.phrase_id AND e.position = s.position
+    WHERE s.due <= ?
+    """, (now, ))
+    return cursor.fetchone()[0]
+
+@traced('db')
+def record_review(phrase_id, position, quality, now=None):
+    """Updates the schedule of one exercise and returns its new interval in days."""
+    if now is None:
+        now = time.time()
+    conn = get_db_conn()
+    with conn:
+        row = conn.execute(f"SELECT ease, interval, repetitions FROM {REVIEW_TABLE_NAME} WHERE phrase_id = ? AND position = ?",
+                           (phrase_id, position)).fetchone()
+        ease, interval, repetitions = sm2(*(row or (2.5, 0, 0)), quality)
+        conn.execute(f"""
+        INSERT OR REPLACE INTO {REVIEW_TABLE_NAME} (phrase_id, position, ease, interval, repetitions, due, reviewed_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (phrase_id, position, ease, interval, repetitions, now + interval * 86400, now))
+    return interval
+
+def start_review(review_language='English'):
+    print(success_text("Due for review: ") + str(count_due_reviews()))
+    exercises = get_review_exercises(REVIEW_SESSION_SIZE)
+    if not exercises:
+        print(warn_text("Nothing to review yet. Look up some phrases first."))
+        wait_for_enter_key()
+        return
+    practice_exercises(exercises, review_language=review_language, schedule=True)
+
+@traced('db')
+def sample_exercises(num_questions):
+    """Picks up to num_questions distinct exercises at random, or all of them shuffled when num_questions <= 0.
+
+    Each pick is a single seek to a random rowid of the examples table, so
+    the cost doesn't depend on the size of the book. Examples right after a
+    gap left by deletions are a little more likely to come up.
+    """
+    conn = get_db_conn()
+    total = get_vocabulary_count('exercises')
+    joins = f"{EXAMPLES_TABLE_NAME} e JOIN {TABLE_NAME} v ON v.id = e.phrase_id"
+    if num_questions <= 0 or total <= num_questions * 2:
+        limit = num_questions if num_questions > 0 else -1
+        rows = conn.execute(f"SELECT {EXERCISE_COLUMNS} FROM {joins} ORDER BY random() LIMIT ?", (limit, )).fetchall()
+        return [Exercise(*row) for row in rows]
+    # separate queries, as SQLite only answers a lone MIN or MAX from the index
+    low = conn.execute(f"SELECT MIN(rowid) FROM {EXAMPLES_TABLE_NAME}").fetchone()[0]
+    high = conn.execute(f"SELECT MAX(rowid) FROM {EXAMPLES_TABLE_NAME}").fetchone()[0]
+    picked = {}
+    for _ in range(num_questions * 10):
+        if len(picked) == num_questions:
+            break
+        row = conn.execute(f"SELECT e.rowid, {EXERCISE_COLUMNS} FROM {joins} WHERE e.rowid >= ? ORDER BY e.rowid LIMIT 1",
+                           (random.randint(low, high), )).fetchone()
+        if row is not None:
+            picked[row[0]] = Exercise(*row[1:])
+    return list(picked.values())
+
+def practice_exercises(exercises, review_language='English', schedule=False):
+    """Asks the exercises one by one; with schedule set, the learner grades each answer for SM-2."""
     global __in_main_menu
     __in_main_menu = False
     clear_console()
-    all_records = get_all_records()
-    question_list = []
-    
-    for id, record in enumerate(all_records):
-        phase = json.loads(record[0])
-        explanation = json.loads(record[1])
-        examples = json.loads(record[2])
-        translates = json.loads(record[3])
-        note = json.loads(record[4]) if record[4] is not None else ""
-        for translate, example in zip(translates, examples):
-            item = (phase, explanation, translate, example, note)
-            question_list.append(item)
-            
-    random.shuffle(question_list)
-    if num_questions > 0:
-        num_questions = min(num_questions, len(question_list))
-        question_list = question_list[:num_questions]
-    
-    for id, question in enumerate(question_list):
-        (phrase, explanation, translate, example, note) = question
-        print(f"\n{id + 1}/{len(question_list)}\t" + success_text(translate))
-        user_trans = get_input("Translate")
-        print("-" * 10)
-        print(success_text("Answer: ") + example)
-        print()
-        print(success_text('Phrase: ') + phrase)
-        print(success_text('Explanation: ') + explanation)
-        if note.strip() != "":
-            print(success_text('Note: ') + note)
-        evaluation = evaluate_translation(phrase, translate, user_trans, language=review_language)
-        print(success_text("Evaluation: ") + evaluation)
-        
-    print(success_text("Test completed!"))
+    grader = ThreadPoolExecutor(max_workers=GRADING_WORKERS)
+    pending = []
+    try:
+        for id, exercise in enumerate(exercises):
+            label = f"{id + 1}/{len(exercises)}"
+            flush_evaluations(pending)
+            print(f"\n{label}\t" + success_text(exercise.translation))
+            user_trans = get_input("Translate")
+            print("-" * 10)
+            print(success_text("Answer: ") + exercise.example)
+            print()
+            print(success_text('Phrase: ') + exercise.phrase)
+            print(success_text('Explanation: ') + exercise.explanation)
+            if exercise.note.strip() != "":
+                print(success_text('Note: ') + exercise.note)
+            submit_evaluation(grader, pending, label, exercise.phrase, exercise.translation, user_trans, review_language)
+            if schedule:
+                grade = get_selection(list(REVIEW_GRADES), "How well did you know it?", default_idx=2)
+                interval = record_review(exercise.phrase_id, exercise.position, REVIEW_GRADES[grade])
+                print(warn_text(f"Next review in {interval} day{'s' if interval != 1 else ''}."))
+
+        flush_evaluations(pending, wait=True)
+    finally:
+        grader.shutdown(wait=False, cancel_futures=True)
+    print(success_text("Review completed!" if schedule else "Test completed!"))
     print('\n' + success_text("<Press ENTER key to continue>"))
     input()
-    show_menu()
+
+def general_practice(num_questions=-1, review_language='English'):
+    practice_exercises(sample_exercises(num_questions), review_language=review_language)
+
+def submit_evaluation(grader, pending, label, voc, chinese, english, review_language):
+    # grade in the background so that the next sentence can be shown right away
+    chunks = []
+    on_token = chunks.append if STREAM_OUTPUT else None
+    # quiet: errors go to future.result(), not over the prompt being typed into
+    future = grader.submit(evaluate_translation, voc, chinese, english, language=review_language, on_token=on_token,
+                           quiet=True)
+    pending.append((label, future, chunks))
+    print(warn_text(f"Evaluation of {label} is on the way ..."))
+
+def flush_evaluations(pending, wait=False):
+    # print finished evaluations in the order the answers were given
+    while pending and (wait or pending[0][1].done()):
+        label, future, chunks = pending.pop(0)
+        print("\n" + success_text(f"Evaluation ({label}): "), end='', flush=True)
+        shown = 0
+        # while waiting, show the evaluation as its tokens arrive
+        while not future.done():
+            shown = print_chunks(chunks, shown)
+            wait_futures([future], timeout=0.05)
+        try:
+            evaluation = future.result() or ""
+        except Exception as e:
+            print(error_text(f"failed: {e}"))
+            continue
+        if shown > 0:
+            print_chunks(chunks, shown)
+            print()
+        else:
+            print(evaluation)
+
+def print_chunks(chunks, shown):
+    end = len(chunks)
+    if end > shown:
+        print(''.join(chunks[shown:end]), end='', flush=True)
+    return end
     
 def practice_phase(voc, examples, translations, review_language='English'):
     global __in_main_menu
     __in_main_menu = False
-    clear_console()
-    print("Translate the following sentence into English using phase " + success_text(voc))
-    for idx, (example, translation) in enumerate(zip(examples, translations)):
-        print("\n" + success_text(translation))
-        user_trans = get_input("Translate:")
-        print(f"Answer: {example}")
-        evaluation = evaluate_translation(voc, translation, user_trans, language=review_language)
-        print(success_text("Evaluation: ") + evaluation)
-    print("\n" + "=" * 10)
-    options = ['Try again', 'Done']
-    idx = options.index(get_selection(options, "Operation"))
-    if idx == 0:
-        return practice_phase(voc, examples, translations)
-    elif idx == 1:
-        return
+    grader = ThreadPoolExecutor(max_workers=GRADING_WORKERS)
+    try:
+        while True:
+            clear_console()
+            print("Translate the following sentence into English using phase " + success_text(voc))
+            pending = []
+            for idx, (example, translation) in enumerate(zip(examples, translations)):
+                flush_evaluations(pending)
+                print("\n" + success_text(translation))
+                user_trans = get_input("Translate:")
+                print(f"Answer: {example}")
+                submit_evaluation(grader, pending, f"{idx + 1}/{len(examples)}", voc, translation, user_trans, review_language)
+            flush_evaluations(pending, wait=True)
+            print("\n" + "=" * 10)
+            options = ['Try again', 'Done']
+            idx = options.index(get_selection(options, "Operation"))
+            if idx == 1:
+                return
+    finally:
+        grader.shutdown(wait=False, cancel_futures=True)
 
-def show_output_json(voc, data_json, pause=True):
+def show_output_json(voc, data_json, pause=True, show_explanation=True):
     global __in_main_menu
     __in_main_menu = False
     phase = voc
     explanation = data_json['explanation']
     examples = data_json['example sentences']
     translations = data_json['translations']
-    print(explanation)
+    if show_explanation:
+        print(explanation)
     print("\n" + success_text("Examples:"))
     for example, translation in zip(examples, translations):
         print(example)
@@ -623,10 +2033,10 @@ def show_output_json(voc, data_json, pause=True):
         input()
 
 def show_menu(show_title=True):
+    """The main menu screen; runs the chosen action and returns the next screen."""
     global DEFAULT_VIEW_OPTION_IDX
     global __in_main_menu
     __in_main_menu = True
-    init_db()
     clear_console()
     if __cloud_user_email is None:
         print(success_text(title()))
@@ -634,47 +2044,99 @@ def show_menu(show_title=True):
         read_chatgpt_key()
     else:
         print(warn_text(title()))
-    
+    start_lookup_worker()
+    pending, failed, last_error = get_lookup_queue_status()
+    if pending or failed:
+        print(warn_text(f"Lookup queue: {pending} waiting" + (f", {failed} failed" if failed else "")
+                        + (f" (last error: {last_error})" if last_error else "")))
     
     DEFAULT_VIEW_OPTION_IDX = 0
-    options = ["Lookup", "Vocabulary Book", "General Test", "Export to CSV","Exit"]
+    options = ["Lookup", "Queue for Later", "Batch Lookup", "Search", "Vocabulary Book", "General Test", "Review Due Items", "Export", "Import", "Exit"]
     answer = get_selection(options, "What do you want to do?")
     if answer is None:
-        exit(0)
+        return Screens.EXIT
     idx = options.index(answer)
     if idx == 0:
         voc = get_input(validate=False)
         if voc.strip() != '':
             try:
-                output_json = get_results(voc)
+                streamer = JsonStringStreamer('explanation') if STREAM_OUTPUT else None
+                output_json = get_results(voc, on_token=streamer.feed if streamer else None)
                 if output_json is not None:
-                    show_output_json(voc, output_json, pause=False)
+                    # a streamed answer that failed to parse was retried, and the
+                    # explanation on screen is not the one being stored
+                    streamed = streamer is not None and streamer.done and streamer.text == output_json['explanation']
+                    show_output_json(voc, output_json, pause=False, show_explanation=not streamed)
                     insert_record(voc, output_json, skip_backup=False)
+            except BackToMenu:
+                raise
             except Exception as e:
                 print(error_text("Failed to get results:") + str(e))
         
             print('\n' + success_text("<Press ENTER key to continue>"))
             input()
-        show_menu()
         
     elif idx == 1:
+        clear_console()
+        queue_for_later()
+    elif idx == 2:
+        path = get_input("Phrase list file (one phrase per line)")
+        options = ["Skip them", "Look them up anyway"]
+        force = get_selection(options, "Phrases that look like forms of another one (e.g. \"went\" for \"go\")?") == options[1]
+        try:
+            batch_lookup(read_phrase_list(os.path.expanduser(path.strip())), force=force)
+        except OSError as e:
+            print(error_text("Failed to read phrase list: ") + str(e))
+        wait_for_enter_key()
+    elif idx == 3:
+        backup_vocabulary()
+        show_search()
+    elif idx == 4:
         options = [ListOrderOptions.RANDOM, ListOrderOptions.EARLIST_FIRST, ListOrderOptions.LATEST_FIRST]
         order = get_selection(options, "Select the browsing order")
         clear_console()
         backup_vocabulary()
         get_all_voc(order_option=order)
-    elif idx == 2:
+    elif idx == 5:
         backup_vocabulary()
         start_general_practice()
-    elif idx == 3:
+    elif idx == 6:
         backup_vocabulary()
-        export_to_csv()
-    elif idx == 4:
-        exit(0)
+        start_review()
+    elif idx == 7:
+        backup_vocabulary()
+        clear_console()
+        export_vocabulary()
+    elif idx == 8:
+        clear_console()
+        import_vocabulary()
+    elif idx == 9:
+        return Screens.EXIT
+    return Screens.MAIN_MENU
+
+def run_screens(screen=Screens.LOGIN):
+    # Every screen returns the next one, so the stack stays flat no matter
+    # how long the session lasts.
+    screens = {
+        Screens.LOGIN: change_version,
+        Screens.MAIN_MENU: show_menu,
+    }
+    while screen != Screens.EXIT:
+        try:
+            with trace_span(screen, 'screen'):
+                screen = screens[screen]()
+        except BackToMenu:
+            screen = Screens.MAIN_MENU
+
+@traced('db')
+def get_sync_state(key, default=None):
+    cursor = get_db_conn().execute("SELECT value FROM sync_state WHERE key = ?", (key, ))
+    row = cursor.fetchone()
+    return json.loads(row[0]) if row is not None else default
+
+def set_sync_state(cursor, key, value):
+    cursor.execute("INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)", (key, json.dumps(value)))
 
-def update_database():
-    add_column_to_table(TABLE_NAME, 'notes', 'TEXT')
-    
 def get_local_config():
     config_path = os.path.join(str(Path.home()), CONFIG_DIR)
     os.makedirs(config_path, exist_ok=True)
@@ -701,109 +2163,352 @@ def save_local_config(key, value):
     with open(general_config_path, 'w') as f:
         json.dump(general_config, f)
         
-def export_to_csv():
-    # Connect to the database
-    conn = get_db_conn()
-
-    # Create a cursor object
-    cursor = conn.cursor()
-
-    # Define the SELECT statement to retrieve all columns from all rows
-    select_all_sql = f"""
-    SELECT * FROM {TABLE_NAME}
+EXPORT_FORMATS = {
+    'csv': "CSV",
+    'jsonl': "JSON Lines",
+    'tsv': "Flashcards (TSV)",
+}
+EXPORT_BUFFER_SIZE = 1 << 16
+
+def record_to_json(record):
+    return {
+        'phrase': record.phrase,
+        'explanation': record.explanation,
+        'examples': record.examples,
+        'translations': record.translations,
+        'note': record.note,
+    }
+
+def flashcard_field(text):
+    # flashcard importers read one card per line and render HTML
+    return text.replace('\t', ' ').replace('\r\n', '<br>').replace('\n', '<br>')
+
+@traced('db')
+def export_records(path, fmt='csv', since=None, notes_only=False):
+    """Streams the vocabulary book into path and returns the number of phrases written.
+
+    since is a timestamp; only phrases changed at or after it are written.
     """
+    where, params = [], []
+    if since is not None:
+        where.append("COALESCE(v.updated_at, 0) >= ?")
+        params.append(since)
+    if notes_only:
+        where.append("COALESCE(v.note, '') != ''")
+    # iter_records walks the cursor lazily, so only one phrase is held at a time
+    records = iter_records(" AND ".join(where), tuple(params))
+    count = 0
+    with open(path, 'w', newline='', encoding='utf-8', buffering=EXPORT_BUFFER_SIZE) as f:
+        if fmt == 'jsonl':
+            for record in records:
+                f.write(json.dumps(record_to_json(record), ensure_ascii=False) + '\n')
+                count += 1
+        elif fmt == 'tsv':
+            # no csv writer here: it would backslash-escape quotes, which the cards then show
+            for record in records:
+                back = [record.explanation]
+                back += [f"{example}<br><i>{translation}</i>" for example, translation in zip(record.examples, record.translations)]
+                if record.note:
+                    back.append(f"Note: {record.note}")
+                f.write(flashcard_field(record.phrase) + '\t' + flashcard_field('<br><br>'.join(back)) + '\n')
+                count += 1
+        else:
+            writer = csv.writer(f)
+            writer.writerow(['Phases', 'Explanations', 'Examples', 'Translations', 'Notes'])
+            for record in records:
+                writer.writerow([record.phrase, record.explanation, '\n'.join(record.examples),
+                                 '\n'.join(record.translations), record.note])
+                count += 1
+    return count
+
+def parse_date(text):
+    return time.mktime(datetime.datetime.strptime(text.strip(), "%Y-%m-%d").timetuple())
+
+def export_vocabulary():
+    labels = list(EXPORT_FORMATS.values())
+    fmt = list(EXPORT_FORMATS)[labels.index(get_selection(labels, "Which format?"))]
+    filters = ["All phrases", "Changed since a date", "With notes only"]
+    choice = filters.index(get_selection(filters, "Which phrases?"))
+    since = None
+    if choice == 1:
+        try:
+            since = parse_date(get_input("Since (YYYY-MM-DD)"))
+        except ValueError:
+            print(error_text("Please enter the date as YYYY-MM-DD."))
+            wait_for_enter_key()
+            return
+    path = get_input("Output file (leave empty for the current directory)", validate=False).strip()
+    if not path:
+        path = f"phases_export_{str(datetime.datetime.now())}.{fmt}".replace(" ", "_")
+    path = os.path.expanduser(path)
 
-    # Execute the SELECT statement
-    cursor.execute(select_all_sql)
-
-    # Fetch all records at once using fetchall()
-    all_records = cursor.fetchall()
-    
-    fname = f"phases_export_{str(datetime.datetime.now())}.csv".replace(" ", "_")
-    with open(fname, 'w', newline='', encoding='utf-8') as csvfile:
-        writer = csv.writer(csvfile)
-        writer.writerow(['Phases', 'Explanations', 'Examples', 'Translations', 'Notes'])
-        for record in all_records:
-            phase = json.loads(record[0])
-            explanation = json.loads(record[1])
-            examples = json.loads(record[2])
-            translates = json.loads(record[3])
-            note = json.loads(record[4]) if record[4] is not None else ""
-            writer.writerow([phase, explanation, '\n'.join(examples), '\n'.join(translates), note])
-            
-    print(success_text(f"Successfully export to csv: {fname}"))
-    time.sleep(2)
-    clear_console()
-    show_menu()
+    start = time.time()
+    try:
+        count = export_records(path, fmt, since=since, notes_only=choice == 2)
+    except OSError as e:
+        print(error_text(f"Failed to export: {e}"))
+    else:
+        print(success_text(f"Successfully exported {count} phrases to {path} in {time.time() - start:.1f}s"))
+    wait_for_enter_key()
 
-def vocabulary_to_json():
-    # Connect to the database
-    conn = get_db_conn()
+IMPORT_BATCH_SIZE = 1000
 
-    # Create a cursor object
-    cursor = conn.cursor()
+def iter_import_rows(path):
+    """Yields (line, item) from an export in CSV, JSON Lines or a JSON array.
 
-    # Define the SELECT statement to retrieve all columns from all rows
-    select_all_sql = f"""
-    SELECT * FROM {TABLE_NAME}
+    item follows the vocabulary_to_json shape, or is None when the line can't be parsed.
     """
+    with open(path, 'r', newline='', encoding='utf-8-sig') as f:
+        head = f.read(1)
+        f.seek(0)
+        if path.endswith('.json') and head == '[':
+            for line, item in enumerate(json.load(f), 1):
+                yield line, item
+        elif path.endswith(('.jsonl', '.json')):
+            for line, text in enumerate(f, 1):
+                if text.strip() == '':
+                    continue
+                try:
+                    yield line, json.loads(text)
+                except ValueError:
+                    yield line, None
+        else:
+            reader = csv.reader(f)
+            next(reader, None)
+            for row in reader:
+                if len(row) < 4:
+                    yield reader.line_num, None
+                    continue
+                phrase, explanation, examples, translations = row[:4]
+                yield reader.line_num, {
+                    'phrase': phrase,
+                    'explanation': explanation,
+                    'examples': examples.splitlines(),
+                    'translations': translations.splitlines(),
+                    'note': row[4] if len(row) > 4 else "",
+                }
+
+def validate_import_item(item):
+    """Returns (phrase, explanation, examples, translations, note), or None if item is malformed."""
+    if not isinstance(item, dict):
+        return None
+    phrase, explanation = item.get('phrase'), item.get('explanation')
+    examples, translations = item.get('examples') or [], item.get('translations') or []
+    note = item.get('note') or ""
+    if not isinstance(phrase, str) or phrase.strip() == '' or not isinstance(explanation, str):
+        return None
+    if not isinstance(examples, list) or not isinstance(translations, list) or not isinstance(note, str):
+        return None
+    if len(examples) != len(translations) or not all(isinstance(text, str) for text in examples + translations):
+        return None
+    return phrase.strip(), explanation, examples, translations, note
 
-    # Execute the SELECT statement
-    cursor.execute(select_all_sql)
+@traced('db')
+def import_batch(conn, batch, updated_at):
+    """Writes one batch of new phrases in a single transaction; returns how many were written."""
+    with conn:
+        return write_records(conn, batch, updated_at)
 
-    # Fetch all records at once using fetchall()
-    all_records = cursor.fetchall()
+def import_records(path, batch_size=IMPORT_BATCH_SIZE):
+    """Imports an exported vocabulary book without any ChatGPT calls.
+
+    Phrases already in the book, or repeated in the file, are skipped.
+    Returns (imported, skipped, invalid).
+    """
+    conn = get_db_conn()
+    updated_at = time.time()
+    start = time.perf_counter()
+    imported = skipped = invalid = batches = 0
+    seen = set()
+    batch = []
+
+    def flush():
+        nonlocal imported, skipped, batches
+        batch_start = time.perf_counter()
+        written = import_batch(conn, batch, updated_at)
+        elapsed = time.perf_counter() - batch_start
+        imported += written
+        skipped += len(batch) - written
+        batches += 1
+        print(f"Batch {batches}: {written}/{len(batch)} new, "
+              f"{len(batch) / max(elapsed, 1e-6):.0f} rows/s")
+        batch.clear()
+
+    for line, item in iter_import_rows(path):
+        row = validate_import_item(item)
+        if row is None:
+            invalid += 1
+            if invalid <= 5:
+                print(warn_text(f"Skipping malformed row at line {line}"))
+            continue
+        key = normalize_phrase(row[0])
+        if key in seen:
+            skipped += 1
+            continue
+        seen.add(key)
+        batch.append(row)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    elapsed = time.perf_counter() - start
+    print(success_text(f"Imported {imported} phrases in {elapsed:.1f}s") +
+          f" ({skipped} already present, {invalid} malformed)")
+    return imported, skipped, invalid
+
+def import_vocabulary():
+    path = get_input("File to import (CSV, JSON Lines)")
+    try:
+        import_records(os.path.expanduser(path.strip()))
+    except (OSError, ValueError, csv.Error) as e:
+        print(error_text("Failed to import: ") + str(e))
+    wait_for_enter_key()
+
+@traced('db')
+def vocabulary_to_json(since=None):
+    if since is None:
+        all_records = iter_records()
+    else:
+        # only the rows changed after the given timestamp
+        all_records = iter_records("COALESCE(v.updated_at, 0) > ?", (since, ))
     
-    # writer.writerow(['Phases', 'Explanations', 'Examples', 'Translations', 'Notes'])
-    json_data = []
-    for record in all_records:
-        item = {}
-        item['phrase'] = json.loads(record[0])
-        item['explanation'] = json.loads(record[1])
-        item['examples'] = json.loads(record[2])
-        item['translations'] = json.loads(record[3])
-        item['note'] = json.loads(record[4]) if record[4] is not None else ""
-        json_data.append(item)
-            
+    json_data = [record_to_json(record) for record in all_records]
+
     # print(success_text(json.dumps(json_data, indent=2)))
     # wait_for_enter_key()
     # clear_console()
     # show_menu()
     return json_data
 
+@traced('sync')
 def backup_vocabulary():
-    import requests
-    from tqdm.auto import tqdm
     if __cloud_user_email is None:
         return
     try:
+        if sync_vocabulary():
+            return
+    except Exception as e:
+        print(error_text(str(e)))
+        return
+    full_backup_vocabulary()
+
+def sync_vocabulary():
+    """Exchanges only the rows changed since the last successful sync.
+
+    Returns False when the server does not support /sync_voc, so that the
+    caller can fall back to a full backup. A 404 is remembered in sync_state
+    and /sync_voc is only asked again after SYNC_PROBE_INTERVAL.
+    """
+    supported = get_sync_state('sync_voc_supported')
+    checked_at = get_sync_state('sync_voc_checked_at', 0)
+    if supported is False and time.time() - checked_at < SYNC_PROBE_INTERVAL:
+        return False
+    conn = get_db_conn()
+    sync_start = time.time()
+    pushed_at = get_sync_state('pushed_at', -1)
+    received = set()
+    if not supported:
+        # ask with an empty change set first, so a server without /sync_voc
+        # does not get the local changes once here and again in the full backup
+        received = post_sync_changes([], [], sync_start)
+        if received is None:
+            return False
+    cursor = conn.execute("SELECT phrase FROM sync_tombstones WHERE deleted_at > ?", (pushed_at, ))
+    deleted = [row[0] for row in cursor.fetchall()]
+    # the rows the probe just pulled are stamped with sync_start, don't echo them back
+    changes = [item for item in vocabulary_to_json(since=pushed_at)
+               if normalize_phrase(item['phrase']) not in received]
+    pulled = post_sync_changes(changes, deleted, sync_start)
+    if pulled is None:
+        return False
+    with conn:
+        conn.execute("DELETE FROM sync_tombstones WHERE deleted_at <= ?", (sync_start, ))
+        set_sync_state(conn.cursor(), 'pushed_at', sync_start)
+    print(success_text(f"vocabulary is synchronized ({len(changes) + len(deleted)} sent, {len(received | pulled)} received)"))
+    return True
+
+def post_sync_changes(changes, deleted, sync_start):
+    """Sends one /sync_voc request and applies the rows the server sends back.
+
+    Returns the keys of the received phrases, or None when the server answers 404.
+    """
+    conn = get_db_conn()
+    resp = server_post("/sync_voc", {
+        'email': __cloud_user_email,
+        'password': __cloud_password,
+        'cursor': get_sync_state('server_cursor'),
+        'changes': changes,
+        'deleted': deleted
+    }, compress=True)
+    if resp is None:
+        raise ConnectionError("Server connection failed ...")
+    if resp.status_code == 404:
+        with conn:
+            set_sync_state(conn.cursor(), 'sync_voc_supported', False)
+            set_sync_state(conn.cursor(), 'sync_voc_checked_at', time.time())
+        return None
+    data = resp.json()
+    if not data['success']:
+        raise RuntimeError("Failed to backup vocabulary: " + data.get('message', ''))
+
+    with conn:
+        cursor = conn.cursor()
+        # remote rows are stamped with sync_start so they are not pushed back
+        rows = [(remote_vocab['phrase'], remote_vocab['explanation'], remote_vocab['examples'],
+                 remote_vocab['translations'], remote_vocab['note'] if remote_vocab['note'].strip() != '' else None)
+                for remote_vocab in data['voc']]
+        for start in range(0, len(rows), IMPORT_BATCH_SIZE):
+            write_records(conn, rows[start:start + IMPORT_BATCH_SIZE], sync_start, replace=True)
+        conn.executemany(f"DELETE FROM {TABLE_NAME} WHERE phrase_key = ?",
+                         [(normalize_phrase(phrase), ) for phrase in data.get('deleted', [])])
+        set_sync_state(cursor, 'server_cursor', data.get('cursor'))
+        set_sync_state(cursor, 'sync_voc_supported', True)
+    return set(normalize_phrase(remote_vocab['phrase']) for remote_vocab in data['voc'])
+
+def full_backup_vocabulary():
+    try:
+        sync_start = time.time()
         voc_data = vocabulary_to_json()
-        latest_voc = requests.post(f"{SERVER_ADDR}/backup_voc", json={
+        latest_voc = server_post("/backup_voc", {
             'email': __cloud_user_email,
             'password': __cloud_password,
             'local_voc': voc_data
-        })
+        }, compress=True)
+        if latest_voc is None:
+            print(error_text("Server connection failed ..."))
+            return
         resp = latest_voc.json()
         if resp['success']:
             remote_voc = resp['voc']
-            local_vocabs = [s['phrase'] for s in voc_data]
+            local_vocabs = set(normalize_phrase(s['phrase']) for s in voc_data)
             print(success_text("Syncronizing local data ..."))
-            for remote_vocab in tqdm(remote_voc):
+            start = time.perf_counter()
+            missing = []
+            for remote_vocab in remote_voc:
                 phrase = remote_vocab['phrase']
-                if phrase not in local_vocabs:
+                phrase_key = normalize_phrase(phrase)
+                if phrase_key not in local_vocabs:
+                    local_vocabs.add(phrase_key)
                     record_json = {
                         'explanation': remote_vocab['explanation'],
                         'example sentences': remote_vocab['examples'],
                         'translations': remote_vocab['translations']
                     }
                     note = remote_vocab['note'] if remote_vocab['note'].strip() != '' else None
-                    insert_record(phrase, record_json, note, skip_backup=True, skip_message=True)
+                    missing.append((phrase, record_json, note))
+            inserted = insert_records(missing, updated_at=sync_start)
+            with get_db_conn() as conn:
+                set_sync_state(conn.cursor(), 'pushed_at', sync_start)
+            elapsed = time.perf_counter() - start
+            if inserted:
+                print(f"Pulled {inserted} phrases in {elapsed:.2f}s ({inserted / max(elapsed, 1e-6):.0f} phrases/s)")
             print(success_text("vocabulary is backed up successfully"))
         else:
             print(error_text("Failed to backup vocabulary"))
 
     except Exception as e:
-        print(error_text(e))
+        print(error_text(str(e)))
 
 def encode_binary_file_to_base64_string(file_path):
     # Read the binary file
@@ -834,7 +2539,7 @@ def read_chatgpt_key():
             chatgpt_key = input("[?] ChatGPT Key: ")
             try:
                 KEY = chatgpt_key
-                chat_with_gpt("hello")
+                chat_with_gpt("hello", use_cache=False)
                 save_local_config(chatgpt_key_label, KEY)
                 print(success_text("ChatGPT Key is saved locally... Entering in 3 seconds ..."))
                 time.sleep(3)
@@ -848,23 +2553,65 @@ def read_chatgpt_key():
         chatgpt_key = key
     KEY = chatgpt_key
         
+def parse_requirement(lib):
+    name, _, version = lib.partition('==')
+    return name.strip(), version.strip() or None
+
+def release_tuple(version):
+    # "0.28" and "0.28.0" are the same release, as pip treats them
+    parts = []
+    for part in version.split('.'):
+        digits = re.match(r'\d*', part).group()
+        if digits == '':
+            break
+        parts.append(int(digits))
+        if digits != part:
+            break
+    while parts and parts[-1] == 0:
+        parts.pop()
+    return tuple(parts)
+
+def find_missing_dependencies(libs):
+    from importlib import metadata
+    missing = []
+    for lib in libs:
+        name, version = parse_requirement(lib)
+        try:
+            installed = metadata.version(name)
+        except metadata.PackageNotFoundError:
+            missing.append(lib)
+            continue
+        if version is not None and release_tuple(installed) != release_tuple(version):
+            missing.append(lib)
+    return missing
+
 def install_dependencies(libs):
+    # Warm starts only read a stamp file; the installed versions are checked
+    # in-process, and pip runs once for whatever is actually missing.
+    stamp_key = hashlib.sha256("\n".join([sys.executable, sys.version] + sorted(libs)).encode('utf-8')).hexdigest()
+    stamp_path = os.path.join(config_path, 'dependencies.stamp')
+    if os.path.exists(stamp_path):
+        with open(stamp_path, 'r') as f:
+            if f.read().strip() == stamp_key:
+                return
     try:
-        py_bin = subprocess.check_output("which python3", shell=True).decode().strip()
-        for lib in libs:
-            ret = subprocess.call(f"{py_bin} -m pip install -q {lib}", shell=True)
-            assert ret == 0, error_text(f"Cannot install library {lib}")
+        missing = find_missing_dependencies(libs)
+        if missing:
+            ret = subprocess.call([sys.executable, "-m", "pip", "install", "-q"] + missing)
+            assert ret == 0, error_text(f"Cannot install libraries {' '.join(missing)}")
+        with open(stamp_path, 'w') as f:
+            f.write(stamp_key)
     except:
         print(error_text("Please make sure python3 and pip are installed in your system."))
 
 def change_version():
+    """The login screen; returns the next screen."""
     global SERVER_ADDR
     clear_console()
-    import requests
     try:
-        remote_config = requests.get(REMOTE_CONFIG_URL).json()
+        remote_config = http_get(REMOTE_CONFIG_URL).json()
         SERVER_ADDR = remote_config['server_addr']
-        if requests.get(SERVER_ADDR).ok:
+        if http_get(SERVER_ADDR).ok:
             print("Server detected!")
             options = ["Cloud (Recommended)", "Local"]
             idx = options.index(get_selection(options, "Select your preferred version (Can be switched anytime in settings.)"))
@@ -876,30 +2623,30 @@ def change_version():
         # cloud
         email = get_input("Email", validate=True)
         is_new = is_user_new(email)
+        if is_new is None:
+            return Screens.LOGIN
         if is_new:
             username = get_input("Username", validate=True)
             password = get_input("Password", validate=True, password=True)
             print(email, username, password)
-            create_user(email, username, password)
+            logged_in = create_user(email, username, password)
         else:
             password = get_input("Password", validate=True, password=True)
-            login_user(email, password)
+            logged_in = login_user(email, password)
+        return Screens.MAIN_MENU if logged_in else Screens.LOGIN
     else:
         # read_chatgpt_key()
-        show_menu()
-        pass
+        return Screens.MAIN_MENU
 
 def wait_for_enter_key():
     print('\n' + success_text("<Press ENTER key to continue>"))
     input()
 
 def is_user_new(email):
-    import requests
-    url = f"{SERVER_ADDR}/is_user_new"
-    resp = requests.post(url, json={
+    resp = server_post("/is_user_new", {
         "email": email
     })
-    if resp.ok:
+    if resp is not None and resp.ok:
         resp_data = resp.json()
         success = resp_data['success']
         if success:
@@ -916,32 +2663,30 @@ def is_user_new(email):
             # print(resp_data)
             print(error_text(f"Failed to verify email: {message}"))
             wait_for_enter_key()
-            change_version()
-            return False
+            return None
     else:
         print(error_text(f"Connection failed... Please try again later ..."))
         wait_for_enter_key()
-        change_version()
-        return False
+        return None
     
 def login_user(email, password):
     global __cloud_user_email
     global __cloud_username
     global __cloud_password
     global KEY
-    import requests
-    url = f"{SERVER_ADDR}/login_user"
-    resp = requests.post(url, json={
+    resp = server_post("/login_user", {
         "email": email,
         "password": password
     })
-    if resp.ok:
+    if resp is not None and resp.ok:
         resp_data = resp.json()
         success = resp_data['success']
         if success:
             user_data = resp_data['data']
             username = user_data['Username']
             print(success_text(f"Welcome back, {username}!"))
+            stop_lookup_worker()
+            close_db_conns()
             __cloud_user_email = email
             __cloud_username = username
             __cloud_password = password
@@ -954,60 +2699,98 @@ def login_user(email, password):
             wait_for_enter_key()
             # vocabulary_to_json()
             init_db()
-            show_menu()
+            return True
         else:
             message = resp_data['message']
             print(error_text(f"Login failed:{message}"))
             wait_for_enter_key()
-            change_version()
+            return False
     else:
         print(error_text(f"Login failed. Please try it later ..."))
         wait_for_enter_key()
-        change_version()
+        return False
 
 def create_user(email, username, password):
     global __cloud_user_email
     global __cloud_username
     global __cloud_password
-    import requests
-    login_user_addr = f"{SERVER_ADDR}/new_user"
     if password.strip() == '':
         print(error_text(f"Password cannot be empty"))
         wait_for_enter_key()
-        change_version()
-    resp = requests.post(login_user_addr, json={
+        return False
+    resp = server_post("/new_user", {
         "email": email,
         "username": username,
         "password": password
     })
-    if resp.ok:
+    if resp is not None and resp.ok:
         resp_data = resp.json()
         success = resp_data['success']
         if success:
             print(success_text(f"Success! Welcome {username}!"))
+            stop_lookup_worker()
+            close_db_conns()
             __cloud_user_email = email
             __cloud_username = username
             __cloud_password = password
             init_db()
             wait_for_enter_key()
-            show_menu()
+            return True
         else:
             message = resp_data['message']
             print(error_text(f"Failed to create user:{message}"))
             wait_for_enter_key()
-            change_version()
+            return False
     else:
         print(error_text(f"Failed to create user. Please try again later."))
         wait_for_enter_key()
-        change_version()
+        return False
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Learn English phrases with ChatGPT.")
+    parser.add_argument('--batch', metavar='FILE',
+                        help="look up every phrase in FILE ('-' for stdin) with the local ChatGPT key and exit")
+    parser.add_argument('--concurrency', type=int, default=BATCH_LOOKUP_CONCURRENCY,
+                        help="number of lookups running at the same time in batch mode")
+    parser.add_argument('--force', action='store_true',
+                        help="in batch mode, also look up phrases that look like forms of a stored or listed one")
+    parser.add_argument('--export', metavar='FILE',
+                        help="export the vocabulary book to FILE and exit")
+    parser.add_argument('--format', choices=list(EXPORT_FORMATS), default='csv',
+                        help="file format used by --export")
+    parser.add_argument('--since', metavar='YYYY-MM-DD', type=parse_date,
+                        help="only export phrases changed since this date")
+    parser.add_argument('--notes-only', action='store_true',
+                        help="only export phrases with a note")
+    parser.add_argument('--import', dest='import_file', metavar='FILE',
+                        help="import an exported vocabulary book (CSV or JSON Lines) and exit")
+    parser.add_argument('--trace', metavar='FILE', default=TRACE_FILE,
+                        help="write a JSON-lines trace of DB, network and ChatGPT calls to FILE (or set PHRASES_TRACE)")
+    parser.add_argument('--profile', metavar='FILE', default=PROFILE_FILE,
+                        help="write cProfile stats of the session to FILE (or set PHRASES_PROFILE)")
+    return parser.parse_args()
 
 if __name__ == "__main__":
+    args = parse_args()
+    if args.trace:
+        start_tracing(args.trace)
+    if args.profile:
+        start_profiling(args.profile)
     try:
         install_dependencies(['inquirer==2.8.0', 'openai==0.28', 'requests', 'tqdm'])
         init_db()
-        change_version()
-        init_db()
-        show_menu()
+        if args.batch:
+            read_chatgpt_key()
+            batch_lookup(read_phrase_list(args.batch), concurrency=args.concurrency, force=args.force)
+            exit(0)
+        if args.export:
+            count = export_records(args.export, args.format, since=args.since, notes_only=args.notes_only)
+            print(success_text(f"Successfully exported {count} phrases to {args.export}"))
+            exit(0)
+        if args.import_file:
+            import_records(args.import_file)
+            exit(0)
+        run_screens(Screens.LOGIN)
         
     except Exception as e:
         print(error_text("Error occurred: " + str(e)))
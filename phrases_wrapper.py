@@ -2,12 +2,18 @@
 import urllib.request
 import os
 from pathlib import Path
-import subprocess
 import shutil
 import time
+import json
+import runpy
+import sys
 
 CONFIG_DIR = "phrases_configs"
 APP_NAME = "phrases"
+APP_URL = "https://raw.githubusercontent.com/songlinhou/phrases/main/phrases.py"
+UPDATE_META_NAME = "update_meta.json"
+# seconds between two update checks, e.g. PHRASES_UPDATE_INTERVAL=0 checks on every launch
+UPDATE_CHECK_INTERVAL = int(os.environ.get("PHRASES_UPDATE_INTERVAL", 6 * 3600))
 
 def title():
     _title = f"""
@@ -25,24 +31,67 @@ def success_text(msg):
     ENDC = '\033[0m'
     return OKGREEN + msg + ENDC
 
-def download_file(url, filename):
-  """Downloads a file from the given URL and saves it as filename."""
+def load_update_meta(meta_path):
+    try:
+        with open(meta_path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_update_meta(meta_path, meta):
+    tmp_path = meta_path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, meta_path)
+
+def download_file(url, filename, meta):
+  """Downloads a file from the given URL and saves it as filename.
+
+  The request is conditional on the ETag / Last-Modified in meta, and the
+  file is replaced atomically, so the current copy survives any failure.
+  Returns True if the file changed.
+  """
+  request = urllib.request.Request(url)
+  if os.path.exists(filename):
+    if meta.get('etag'):
+      request.add_header('If-None-Match', meta['etag'])
+    if meta.get('last_modified'):
+      request.add_header('If-Modified-Since', meta['last_modified'])
   try:
-    with urllib.request.urlopen(url) as response, open(filename, 'wb') as out_file:
+    with urllib.request.urlopen(request, timeout=10) as response:
       data = response.read()
-      out_file.write(data)
-    #   print(f"File downloaded successfully: {filename}")
-  except urllib.error.URLError as e:
+      etag = response.headers.get('ETag')
+      last_modified = response.headers.get('Last-Modified')
+  except urllib.error.HTTPError as e:
+    if e.code != 304:
+      print(f"Error downloading file: {e}")
+    return False
+  except (urllib.error.URLError, OSError) as e:
     print(f"Error downloading file: {e}")
+    return False
+  tmp_path = filename + ".download"
+  with open(tmp_path, 'wb') as out_file:
+    out_file.write(data)
+  os.chmod(tmp_path, 0o755)
+  os.replace(tmp_path, filename)
+  meta['etag'] = etag
+  meta['last_modified'] = last_modified
+  return True
     
 def update_app():
-    url = "https://raw.githubusercontent.com/songlinhou/phrases/main/phrases.py"
     config_path = os.path.join(str(Path.home()), CONFIG_DIR)
+    os.makedirs(config_path, exist_ok=True)
     app_path = os.path.join(config_path, APP_NAME)
+    meta_path = os.path.join(config_path, UPDATE_META_NAME)
+    meta = load_update_meta(meta_path)
+    now = time.time()
+    if os.path.exists(app_path) and now - meta.get('checked_at', 0) < UPDATE_CHECK_INTERVAL:
+        return app_path
+    print("Checking for updates ...")
+    download_file(APP_URL, app_path, meta)
     if os.path.exists(app_path):
-        os.remove(app_path)
-    download_file(url, app_path)
-    subprocess.call(f'chmod +x "{app_path}"', shell=True)
+        meta['checked_at'] = now
+        save_update_meta(meta_path, meta)
     return app_path
 
 
@@ -58,30 +107,19 @@ def add_to_path():
     
     bash_rc = os.path.expanduser("~/.bashrc")
     cmd = f"alias {APP_NAME}='python3 \"{wrapper_path}\"'"
-    check_cmd = f'cat ~/.bashrc | grep "alias {APP_NAME}="'
-    existing_found = True
-    try:
-        _ = subprocess.check_output(check_cmd, shell=True)
-        existing_found = True
-    except:
-        existing_found = False
-    if existing_found:
-        # find existing one
+    lines = []
+    if os.path.exists(bash_rc):
         with open(bash_rc, 'r') as f:
-            lines = f.readlines()
-        target_remove_line_ids = []
-        for idx, line in enumerate(lines):
-            if line.startswith(f"alias {APP_NAME}="):
-                target_remove_line_ids.append(idx)
-        
-        _ = [lines.remove(lines[id]) for id in target_remove_line_ids]
-        lines = [l.rstrip() for l in lines if l.strip() != ""]
-        recovered = '\n'.join(lines)
+            lines = f.read().splitlines()
+    aliases = [line for line in lines if line.startswith(f"alias {APP_NAME}=")]
+    if aliases != [cmd]:
+        # drop any outdated alias and append the current one
+        lines = [l for l in lines if not l.startswith(f"alias {APP_NAME}=")]
+        if lines and lines[-1].strip() != "":
+            lines.append("")
+        lines.append(cmd)
         with open(bash_rc, 'w') as f:
-            f.write(recovered)
-    run_cmd = f"echo \"\n{cmd}\" >> ~/.bashrc"
-    # print("run_cmd=", run_cmd)
-    ret = subprocess.call(run_cmd, shell=True)
+            f.write('\n'.join(lines) + '\n')
     if not quick_start:
         print(success_text(f"Open a new terminal and just use command '{APP_NAME}' to start app! Try it!"))
         print(f"Entering in 3 seconds ... Use '{APP_NAME}' to enter app immediately")
@@ -89,9 +127,14 @@ def add_to_path():
     
                 
         
+def run_app(app_path):
+    # run the app in this interpreter instead of spawning another python3
+    sys.argv = [app_path] + sys.argv[1:]
+    runpy.run_path(app_path, run_name='__main__')
+
 if __name__ == '__main__':
     print(success_text(title()))
-    print("Checking for updates ...")
     app_path = update_app()
     add_to_path()
-    subprocess.call(f"python3 '{app_path}'", shell=True)
\ No newline at end of file
+    if os.path.exists(app_path):
+        run_app(app_path)
\ No newline at end of file